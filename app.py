@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+import json
 import os
 from dotenv import load_dotenv
 
@@ -7,6 +8,38 @@ load_dotenv()
 
 API_BASE = "http://localhost:8000"  # FastAPI backend URL
 
+# Streamlit reruns the whole script on every interaction; these backend reads are cached
+# for this many seconds instead of being refetched (and their tokens re-verified) each time
+AUTH_STATUS_TTL = int(os.getenv("APP_AUTH_STATUS_TTL", "60"))
+USER_INFO_TTL = int(os.getenv("APP_USER_INFO_TTL", "300"))
+SOURCES_TTL = int(os.getenv("APP_SOURCES_TTL", "300"))
+
+def http():
+    """Keep-alive HTTP session for this browser session, so reruns reuse pooled connections"""
+    if "http_session" not in st.session_state:
+        st.session_state.http_session = requests.Session()
+    return st.session_state.http_session
+
+# Only successful responses are cached: a non-200 raises, and Streamlit doesn't cache exceptions
+@st.cache_data(ttl=AUTH_STATUS_TTL, show_spinner=False)
+def fetch_auth_status(_session, token):
+    response = _session.get(f"{API_BASE}/auth-status", headers={"Authorization": f"Bearer {token}"}, timeout=5)
+    response.raise_for_status()
+    return response.json()
+
+@st.cache_data(ttl=USER_INFO_TTL, show_spinner=False)
+def fetch_user_info(_session, token):
+    response = _session.get(f"{API_BASE}/user-info", headers={"Authorization": f"Bearer {token}"}, timeout=5)
+    response.raise_for_status()
+    return response.json()
+
+@st.cache_data(ttl=SOURCES_TTL, show_spinner=False)
+def fetch_sources(_session, token):
+    """Cleared after uploads, scrapes and clears, which are what change the sources"""
+    response = _session.get(f"{API_BASE}/sources", headers={"Authorization": f"Bearer {token}"}, timeout=5)
+    response.raise_for_status()
+    return response.json().get("sources", [])
+
 # =========================
 # ✅ Clerk Auth Token Check
 # =========================
@@ -29,11 +62,10 @@ headers = {"Authorization": f"Bearer {token}"}
 def check_auth_with_retry():
     """Check authentication with retry mechanism"""
     try:
-        response = requests.get(f"{API_BASE}/auth-status", headers=headers, timeout=5)
-        if response.status_code == 200:
-            return True, None
-        else:
-            return False, f"Auth check failed: {response.status_code}"
+        fetch_auth_status(http(), token)
+        return True, None
+    except requests.exceptions.HTTPError as e:
+        return False, f"Auth check failed: {e.response.status_code}"
     except Exception as e:
         return False, f"Auth check error: {str(e)}"
 
@@ -66,15 +98,14 @@ with col2:
     st.title("🔍 RAG Q&A Engine")
     st.markdown("*Your intelligent document analysis companion*")
 
+# Get user info from the token (shared by the header and the sidebar)
+user_info = None
+try:
+    user_info = fetch_user_info(http(), token)
+except:
+    pass
+
 with col3:
-    # Get user info from the token
-    user_info = None
-    try:
-        user_response = requests.get(f"{API_BASE}/user-info", headers=headers)
-        if user_response.status_code == 200:
-            user_info = user_response.json()
-    except:
-        pass
     
     # User Profile Dropdown
     if user_info and user_info.get("user_id"):
@@ -118,16 +149,6 @@ with st.sidebar:
     # User Profile Section
     st.markdown("### 👤 User Profile")
     
-    # Try to get user info from the token
-    user_info = None
-    try:
-        # Make a request to get user info from backend
-        user_response = requests.get(f"{API_BASE}/user-info", headers=headers)
-        if user_response.status_code == 200:
-            user_info = user_response.json()
-    except:
-        pass
-    
     # Display user info
     if user_info and user_info.get("user_id"):
         col1, col2 = st.columns([1, 3])
@@ -183,19 +204,32 @@ with st.sidebar:
     uploaded_files = st.file_uploader("Choose files", accept_multiple_files=True, type=["pdf", "docx", "txt", "md"])
 
     if uploaded_files and st.button("Process Documents"):
-        for file in uploaded_files:
-            files = {"file": (file.name, file, file.type)}
-            try:
-                res = requests.post(f"{API_BASE}/upload", files=files, headers=headers)
+        # One request for all files; the backend streams a result line per file as it's embedded
+        files = [("files", (file.name, file, file.type)) for file in uploaded_files]
+        progress = st.progress(0.0, text=f"⏳ Uploading {len(files)} files...")
+        done = 0
+        try:
+            with http().post(f"{API_BASE}/upload/batch", files=files, headers=headers, stream=True, timeout=600) as res:
                 if res.status_code == 200:
-                    st.success(f"✅ Uploaded: {file.name}")
+                    for line in res.iter_lines():
+                        if not line:
+                            continue
+                        result = json.loads(line)
+                        done += 1
+                        progress.progress(done / len(files), text=f"⏳ Processed {done}/{len(files)} files")
+                        if result["status"] == "embedded":
+                            st.success(f"✅ Uploaded: {result['filename']}")
+                        else:
+                            st.error(f"❌ {result['filename']} — {result.get('error', 'failed')}")
+                    progress.progress(1.0, text=f"✅ Processed {done}/{len(files)} files")
+                    fetch_sources.clear()
                 elif res.status_code == 401:
                     st.error("🔐 Authentication expired. Please refresh from the dashboard.")
                     st.markdown("[🔄 Return to Dashboard](http://localhost:3000/dashboard)")
                 else:
-                    st.error(f"❌ {file.name} — {res.text}")
-            except Exception as e:
-                st.error(f"⚠️ Upload error for {file.name}: {e}")
+                    st.error(f"❌ Upload failed — {res.text}")
+        except Exception as e:
+            st.error(f"⚠️ Upload error after {done}/{len(files)} files: {e}")
 
 # =========================
 # 🌐 Sidebar - Scrape Website
@@ -210,8 +244,9 @@ with st.sidebar:
         if st.button("🗑️ Clear DB", help="Clear all stored documents"):
             with st.spinner("Clearing database..."):
                 try:
-                    clear_res = requests.post(f"{API_BASE}/clear-all", headers=headers)
+                    clear_res = http().post(f"{API_BASE}/clear-all", headers=headers)
                     if clear_res.status_code == 200:
+                        fetch_sources.clear()
                         st.success("✅ Database cleared!")
                         st.rerun()
                     else:
@@ -225,9 +260,10 @@ with st.sidebar:
                 # Add timeout and show progress
                 with st.empty():
                     st.info("🔄 Clearing old data and scraping new website...")
-                    res = requests.post(f"{API_BASE}/scrape", json={"url": url}, headers=headers, timeout=120)
+                    res = http().post(f"{API_BASE}/scrape", json={"url": url}, headers=headers, timeout=120)
                     
                 if res.status_code == 200:
+                    fetch_sources.clear()
                     result = res.json()
                     if result.get("success"):
                         st.success("✅ Website scraped successfully! Old data cleared.")
@@ -264,13 +300,9 @@ st.header("💬 Chat")
 
 # Get available sources for display (but only show if multiple sources exist)
 try:
-    sources_response = requests.get(f"{API_BASE}/sources", headers=headers, timeout=5)
-    if sources_response.status_code == 200:
-        available_sources = sources_response.json().get("sources", [])
-        if len(available_sources) > 1:  # Only show if multiple sources
-            st.info(f"📚 Available sources: {', '.join(available_sources)}")
-    else:
-        available_sources = []
+    available_sources = fetch_sources(http(), token)
+    if len(available_sources) > 1:  # Only show if multiple sources
+        st.info(f"📚 Available sources: {', '.join(available_sources)}")
 except:
     available_sources = []
 
@@ -294,7 +326,7 @@ if prompt := st.chat_input("Ask a question..."):
 
     with st.spinner("Thinking..."):
         try:
-            res = requests.post(f"{API_BASE}/chat", json={"prompt": prompt}, headers=headers, timeout=60)
+            res = http().post(f"{API_BASE}/chat", json={"prompt": prompt}, headers=headers, timeout=60)
             if res.status_code == 200:
                 response_data = res.json()
                 response_content = {
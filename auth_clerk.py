@@ -1,14 +1,17 @@
+import asyncio
+import httpx
 import jwt
-import requests
 import os
 import pathlib
-from fastapi import HTTPException, Depends, status
+import threading
+import time
+from collections import OrderedDict
+from fastapi import HTTPException, Depends, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional, Dict
-from functools import lru_cache
 import logging
-import json
 from dotenv import load_dotenv
+from backend.services.metrics import record_cache, record_timing
 
 root_env_path = pathlib.Path(__file__).parent / ".env"
 load_dotenv(dotenv_path=root_env_path)
@@ -19,35 +22,227 @@ logger = logging.getLogger(__name__)
 CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL", "https://bold-dragon-0.clerk.accounts.dev/.well-known/jwks.json")
 CLERK_AUDIENCE = os.getenv("CLERK_AUDIENCE")
 
-print(f"🔧 Clerk Configuration:")
-print(f"   JWKS URL: {CLERK_JWKS_URL}")
-print(f"   Audience: {CLERK_AUDIENCE or 'None (audience verification disabled)'}")
+# Verified-token cache: bounded LRU, entries never outlive the token's own `exp`
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "1024"))
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "300"))
+
+# JWKS refresh: keys are re-fetched every JWKS_TTL seconds in the background, failed
+# fetches are retried after JWKS_RETRY_INTERVAL, and an unknown kid triggers at most
+# one refetch per JWKS_MIN_REFETCH_INTERVAL
+JWKS_TTL = float(os.getenv("JWKS_TTL", "3600"))
+JWKS_RETRY_INTERVAL = float(os.getenv("JWKS_RETRY_INTERVAL", "30"))
+JWKS_MIN_REFETCH_INTERVAL = float(os.getenv("JWKS_MIN_REFETCH_INTERVAL", "30"))
+JWKS_FETCH_TIMEOUT = float(os.getenv("JWKS_FETCH_TIMEOUT", "10"))
+
+logger.info(f"Clerk JWKS URL: {CLERK_JWKS_URL}, audience: {CLERK_AUDIENCE or 'None (audience verification disabled)'}")
 
 security = HTTPBearer()
 
-@lru_cache(maxsize=1)
-def get_jwks():
-    try:
-        logger.info(f"Fetching JWKS from: {CLERK_JWKS_URL}")
-        response = requests.get(CLERK_JWKS_URL, timeout=10)
-        response.raise_for_status()
-        jwks_data = response.json()
-        logger.info(f"Successfully fetched JWKS with {len(jwks_data.get('keys', []))} keys")
-        return jwks_data
-    except Exception as e:
-        logger.error(f"Failed to fetch JWKS: {e}")
+class TokenCache:
+    """Thread-safe LRU cache of verified token payloads with per-entry expiry"""
+
+    def __init__(self, maxsize=AUTH_TOKEN_CACHE_SIZE, ttl=AUTH_TOKEN_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if expires_at <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return payload
+
+    def put(self, token: str, payload: Dict):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        if expires_at <= time.time():
+            return
+        with self._lock:
+            self._entries[token] = (expires_at, payload)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+token_cache = TokenCache()
+
+class JWKSProvider:
+    """Async JWKS source with TTL, background refresh and stale-on-error keys.
+
+    Keys are parsed once per fetch and looked up by kid. A failed fetch keeps
+    serving the last good key set; an unknown kid triggers a rate-limited refetch
+    so key rotation is picked up without a restart.
+    """
+
+    def __init__(
+        self,
+        url: str = CLERK_JWKS_URL,
+        ttl: float = JWKS_TTL,
+        retry_interval: float = JWKS_RETRY_INTERVAL,
+        min_refetch_interval: float = JWKS_MIN_REFETCH_INTERVAL,
+        timeout: float = JWKS_FETCH_TIMEOUT,
+    ):
+        self.url = url
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self.min_refetch_interval = min_refetch_interval
+        self.timeout = timeout
+        self._keys: Dict[str, object] = {}
+        self._fetched_at: Optional[float] = None
+        self._last_attempt: Optional[float] = None
+        self._last_error: Optional[str] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def kids(self):
+        return list(self._keys)
+
+    def is_stale(self) -> bool:
+        return self._fetched_at is None or time.monotonic() - self._fetched_at >= self.ttl
+
+    async def start(self):
+        """Start the background refresh loop (first fetch happens immediately)"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def wait_until_loaded(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the first successful key fetch (used by the startup warm-up)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._fetched_at is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise RuntimeError(f"JWKS not loaded: {self._last_error or 'timed out'}")
+            await asyncio.sleep(0.05)
+        return True
+
+    async def refresh(self) -> bool:
+        """Fetch the key set now; on failure the previous keys stay in place"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            return await self._fetch()
+
+    def load_jwks(self, jwks_data: Dict) -> int:
+        """Parse a JWKS document and replace the current key set"""
+        keys = {}
+        for jwk in jwks_data.get('keys', []):
+            kid = jwk.get('kid')
+            if not kid:
+                continue
+            try:
+                keys[kid] = jwt.algorithms.RSAAlgorithm.from_jwk(jwk)
+            except Exception as e:
+                logger.warning(f"Skipping unusable JWKS key {kid}: {e}")
+
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+        self._last_error = None
+        return len(keys)
+
+    async def get_signing_key(self, kid: str):
+        key = self._keys.get(kid)
+        record_cache("jwks_key", key is not None)
+        if key is not None:
+            if self.is_stale() and self._refresh_task is None:
+                # No background loop running - revalidate without blocking this request
+                self._refresh_task = asyncio.create_task(self._refresh_once())
+            return key
+
+        await self._refetch_for_miss()
+
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+        if self._fetched_at is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Authentication service unavailable: {self._last_error}"
+            )
+        logger.error(f"Key ID {kid} not found. Available keys: {self.kids}")
         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Authentication service unavailable: {str(e)}"
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Unable to find key for kid: {kid}"
         )
 
-def get_signing_key(token: str):
+    async def _refetch_for_miss(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        requested_at = time.monotonic()
+        async with self._lock:
+            # Another request refreshed while we waited for the lock
+            if self._last_attempt is not None and self._last_attempt >= requested_at:
+                return
+            if (self._last_attempt is not None
+                    and time.monotonic() - self._last_attempt < self.min_refetch_interval):
+                return
+            await self._fetch()
+
+    async def _fetch(self) -> bool:
+        self._last_attempt = time.monotonic()
+        try:
+            if self._client is None:
+                self._client = httpx.AsyncClient(timeout=self.timeout)
+            logger.info(f"Fetching JWKS from: {self.url}")
+            response = await self._client.get(self.url)
+            response.raise_for_status()
+            count = self.load_jwks(response.json())
+            logger.info(f"Successfully fetched JWKS with {count} keys")
+            return True
+        except Exception as e:
+            self._last_error = str(e)
+            if self._keys:
+                logger.error(f"Failed to fetch JWKS, serving {len(self._keys)} cached keys: {e}")
+            else:
+                logger.error(f"Failed to fetch JWKS: {e}")
+            return False
+
+    async def _refresh_once(self):
+        try:
+            await self.refresh()
+        finally:
+            self._refresh_task = None
+
+    async def _refresh_loop(self):
+        while True:
+            ok = await self.refresh()
+            await asyncio.sleep(self.ttl if ok else self.retry_interval)
+
+jwks_provider = JWKSProvider()
+
+async def get_signing_key(token: str):
     try:
         header = jwt.get_unverified_header(token)
         kid = header.get('kid')
         
-        logger.debug(f"Token header: {header}")
-        logger.debug(f"Key ID (kid): {kid}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Token header: {header}")
         
         if not kid:
             raise HTTPException(
@@ -55,20 +250,7 @@ def get_signing_key(token: str):
                 detail="Token missing key ID (kid)"
             )
         
-        jwks = get_jwks()
-        
-        for key in jwks.get('keys', []):
-            if key.get('kid') == kid:
-                logger.debug(f"Found matching key for kid: {kid}")
-                return jwt.algorithms.RSAAlgorithm.from_jwk(key)
-        
-        available_kids = [k.get('kid') for k in jwks.get('keys', [])]
-        logger.error(f"Key ID {kid} not found. Available keys: {available_kids}")
-        
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Unable to find key for kid: {kid}"
-        )
+        return await jwks_provider.get_signing_key(kid)
     except HTTPException:
         raise
     except Exception as e:
@@ -78,7 +260,19 @@ def get_signing_key(token: str):
             detail=f"Error processing token: {str(e)}"
         )
 
-def verify_clerk_token(token: str) -> Dict:
+async def verify_clerk_token(token: str) -> Dict:
+    start = time.perf_counter()
+    try:
+        # Hot path: token already verified and not yet expired
+        cached = token_cache.get(token)
+        record_cache("auth_token", cached is not None)
+        if cached is not None:
+            return cached
+        return await _decode_clerk_token(token)
+    finally:
+        record_timing("auth", time.perf_counter() - start)
+
+async def _decode_clerk_token(token: str) -> Dict:
     try:
         logger.debug(f"Verifying token of length: {len(token)}")
         
@@ -103,10 +297,7 @@ def verify_clerk_token(token: str) -> Dict:
                 detail="Invalid token format: not a JWT or session token"
             )
         
-        unverified_payload = jwt.decode(token, options={"verify_signature": False})
-        logger.debug(f"Unverified payload: {json.dumps(unverified_payload, indent=2)}")
-        
-        signing_key = get_signing_key(token)
+        signing_key = await get_signing_key(token)
         
         # More lenient verification options - disable strict timing checks
         verify_options = {
@@ -117,8 +308,6 @@ def verify_clerk_token(token: str) -> Dict:
             "verify_aud": False   # Disable audience check
         }
         
-        logger.debug(f"Verification options: {verify_options}")
-        
         payload = jwt.decode(
             token,
             signing_key,
@@ -128,6 +317,7 @@ def verify_clerk_token(token: str) -> Dict:
         )
         
         logger.info(f"Token verified successfully for user: {payload.get('sub')}")
+        token_cache.put(token, payload)
         return payload
         
     except jwt.ExpiredSignatureError:
@@ -148,6 +338,8 @@ def verify_clerk_token(token: str) -> Dict:
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Invalid token: {str(e)}"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error during token verification: {e}")
         raise HTTPException(
@@ -155,16 +347,23 @@ def verify_clerk_token(token: str) -> Dict:
             detail=f"Token verification failed: {str(e)}"
         )
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
-    logger.debug(f"Authenticating user with token: {credentials.credentials[:20]}...")
-    return verify_clerk_token(credentials.credentials)
+async def get_current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> Dict:
+    # Router-level and endpoint dependencies share the result for this request
+    user = getattr(request.state, "clerk_user", None)
+    if user is not None:
+        return user
+    user = await verify_clerk_token(credentials.credentials)
+    request.state.clerk_user = user
+    return user
 
-def get_current_user_id(user: Dict = Depends(get_current_user)) -> str:
+async def get_current_user_id(user: Dict = Depends(get_current_user)) -> str:
     user_id = user.get('sub')  # Clerk uses 'sub' for user ID
     if not user_id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token: missing user ID"
         )
-    logger.debug(f"Extracted user ID: {user_id}")
     return user_id
@@ -1,65 +1,181 @@
 # backend/routes/chat.py
 
-from fastapi import APIRouter, Depends, Request
-from pydantic import BaseModel
+import asyncio
+import json
+import os
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Request, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 from auth_clerk import get_current_user_id, get_current_user
 from backend.services.gemini_client import GeminiClient
-from backend.services.document_processor import DocumentProcessor
+from backend.services.document_processor import get_document_processor
+from backend.services.singleflight import SingleFlight
+from backend.services.admission import admission, chat_admission
 
 router = APIRouter()
 gemini = GeminiClient()
-doc_processor = DocumentProcessor()
+doc_processor = get_document_processor()
 
-class ChatRequest(BaseModel):
+# Batch chat limits
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))
+CHAT_BATCH_MAX_PROMPTS = int(os.getenv("CHAT_BATCH_MAX_PROMPTS", "1000"))
+# Share one retrieval + generation between identical concurrent questions
+CHAT_COALESCING = os.getenv("CHAT_COALESCING", "1") == "1"
+CHAT_MAX_FETCH_K = int(os.getenv("CHAT_MAX_FETCH_K", "100"))
+
+chat_flight = SingleFlight("chat")
+
+class RetrievalOptions(BaseModel):
+    # Maximal-marginal-relevance reranking of the retrieved chunks; unset fields use the MMR_* settings
+    mmr: Optional[bool] = None
+    mmr_lambda: Optional[float] = Field(None, ge=0.0, le=1.0)
+    fetch_k: Optional[int] = Field(None, ge=1, le=CHAT_MAX_FETCH_K)
+
+    def retrieval_options(self):
+        options = {"mmr": self.mmr, "mmr_lambda": self.mmr_lambda, "fetch_k": self.fetch_k}
+        return {name: value for name, value in options.items() if value is not None}
+
+class ChatRequest(RetrievalOptions):
     prompt: str
 
-@router.post("/chat")
-async def chat_endpoint(
-    data: ChatRequest,
-    user_id: str = Depends(get_current_user_id)
-):
-    # Query documents with source information
-    docs_with_sources = doc_processor.query_documents(data.prompt, n_results=5)
-    
-    if docs_with_sources:
-        # Format context without source names in the content
-        context_parts = []
-        sources_used = set()
-        
-        for doc_info in docs_with_sources:
-            content = doc_info['content']
-            source = doc_info['source']
-            sources_used.add(source)
-            context_parts.append(content)  # Just the content, no source labels
-        
-        context = "\n\n".join(context_parts)
-        
-        # Simple prompt without source mentions
-        enhanced_prompt = f"""
-Based on the following documents, please answer the question: {data.prompt}
+class ChatBatchRequest(RetrievalOptions):
+    prompts: List[str]
+    source_filter: Optional[str] = None
+
+def build_enhanced_prompt(prompt, docs_with_sources):
+    """Build the LLM prompt, context and source list from retrieved documents"""
+    # Format context without source names in the content
+    context_parts = []
+    sources_used = set()
+
+    for doc_info in docs_with_sources:
+        sources_used.add(doc_info['source'])
+        context_parts.append(doc_info['content'])  # Just the content, no source labels
+
+    context = "\n\n".join(context_parts)
+
+    # Simple prompt without source mentions
+    enhanced_prompt = f"""
+Based on the following documents, please answer the question: {prompt}
 
 {context}
 
 Please provide a clear and concise answer.
 """
-        
-        answer = gemini.generate_response(enhanced_prompt, context)
-        
-        # Add source information to response (but not shown in UI)
-        response = {
-            "answer": answer,
+    return enhanced_prompt, context, sources_used
+
+def normalize_prompt(prompt):
+    return " ".join(prompt.split()).casefold()
+
+def answer_from_documents(prompt, docs_with_sources, llm_without_documents=True):
+    """Generate the answer for a prompt from its retrieved documents (blocking).
+
+    Without documents the LLM answers the bare prompt, or answer is None when
+    llm_without_documents is False so the caller can word its own reply.
+    """
+    if docs_with_sources:
+        enhanced_prompt, context, sources_used = build_enhanced_prompt(prompt, docs_with_sources)
+        return {
+            "answer": gemini.generate_response(enhanced_prompt, context),
             "sources_used": list(sources_used),
             "num_documents": len(docs_with_sources)
         }
-    else:
-        answer = gemini.generate_response(data.prompt, "")
-        response = {
-            "answer": answer,
-            "sources_used": [],
-            "num_documents": 0
-        }
-    
-    return response
+    return {
+        "answer": gemini.generate_response(prompt, "") if llm_without_documents else None,
+        "sources_used": [],
+        "num_documents": 0
+    }
+
+def retrieve_and_answer(prompt, source_filter=None, llm_without_documents=True, retrieval_options=None):
+    """Query documents with source information, then answer from them (blocking)"""
+    docs_with_sources = doc_processor.query_documents_by_source(
+        prompt, source_filter=source_filter, n_results=5, **(retrieval_options or {})
+    )
+    return answer_from_documents(prompt, docs_with_sources, llm_without_documents)
+
+async def run_coalesced(prompt, source_filter, llm_without_documents, retrieval_options, fn, *args):
+    """Run fn in the threadpool, sharing the result with identical in-flight questions.
+
+    Questions are identical when the normalized prompt, source filter, retrieval options
+    and no-documents behaviour match and the corpus hasn't changed since the in-flight
+    one started.
+    """
+    if not CHAT_COALESCING:
+        return await run_in_threadpool(fn, *args)
+    key = (
+        normalize_prompt(prompt), source_filter or None, llm_without_documents,
+        tuple(sorted(retrieval_options.items())), doc_processor.generation
+    )
+    result = await chat_flight.do(key, run_in_threadpool, fn, *args)
+    return dict(result)  # followers share the leader's dict - never hand it out for mutation
+
+@router.post("/chat")
+async def chat_endpoint(
+    data: ChatRequest,
+    user_id: str = Depends(admission(chat_admission))
+):
+    # Source information is included in the response (but not shown in UI)
+    options = data.retrieval_options()
+    return await run_coalesced(data.prompt, None, True, options, retrieve_and_answer, data.prompt, None, True, options)
+
+@router.post("/chat/batch")
+async def chat_batch_endpoint(
+    data: ChatBatchRequest,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Answer many prompts at once, streaming one NDJSON line per prompt as it finishes"""
+    if not data.prompts:
+        raise HTTPException(status_code=400, detail="No prompts provided")
+    if len(data.prompts) > CHAT_BATCH_MAX_PROMPTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many prompts: {len(data.prompts)} (max {CHAT_BATCH_MAX_PROMPTS})"
+        )
+    # Every prompt is an LLM call, so the batch costs what that many /chat requests would
+    chat_admission.check_batch(user_id, len(data.prompts))
+
+    # One batched encode and one vector search for every prompt
+    options = data.retrieval_options()
+    all_docs = await run_in_threadpool(
+        doc_processor.query_documents_batch,
+        data.prompts,
+        n_results=5,
+        source_filter=data.source_filter,
+        **options
+    )
+
+    semaphore = asyncio.Semaphore(CHAT_BATCH_CONCURRENCY)
+
+    async def answer_one(index, prompt, docs_with_sources):
+        # Repeated prompts within the batch, or matching /chat requests, share one LLM call
+        # Each LLM call also queues fairly with everyone else's chat traffic
+        try:
+            async with semaphore, chat_admission.slot(user_id, bounded_queue=False):
+                result = await run_coalesced(
+                    prompt, data.source_filter, True, options, answer_from_documents, prompt, docs_with_sources
+                )
+        except HTTPException as e:
+            # Waited longer than CHAT_MAX_QUEUE_WAIT for a slot; the rest of the batch carries on
+            return {"index": index, "prompt": prompt, "error": e.detail, "status_code": e.status_code}
+        return {"index": index, "prompt": prompt, **result}
+
+    async def stream_results():
+        tasks = [
+            asyncio.ensure_future(answer_one(i, prompt, docs))
+            for i, (prompt, docs) in enumerate(zip(data.prompts, all_docs))
+        ]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                yield json.dumps(result) + "\n"
+        finally:
+            # Client went away - don't keep spending LLM calls on it
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
 
 @router.get("/sources")
 async def get_sources(user_id: str = Depends(get_current_user_id)):
@@ -71,55 +187,14 @@ async def get_sources(user_id: str = Depends(get_current_user_id)):
 async def chat_by_source_endpoint(
     data: ChatRequest,
     source_filter: str = None,
-    user_id: str = Depends(get_current_user_id)
+    user_id: str = Depends(admission(chat_admission))
 ):
     """Chat with documents filtered by source"""
-    if source_filter:
-        docs_with_sources = doc_processor.query_documents_by_source(
-            data.prompt, 
-            source_filter=source_filter, 
-            n_results=5
-        )
-    else:
-        docs_with_sources = doc_processor.query_documents(data.prompt, n_results=5)
-    
-    if docs_with_sources:
-        # Format context without source names
-        context_parts = []
-        sources_used = set()
-        
-        for doc_info in docs_with_sources:
-            content = doc_info['content']
-            source = doc_info['source']
-            sources_used.add(source)
-            context_parts.append(content)
-        
-        context = "\n\n".join(context_parts)
-        
-        # Simple prompt
-        enhanced_prompt = f"""
-Based on the following documents, please answer the question: {data.prompt}
-
-{context}
-
-Please provide a clear and concise answer.
-"""
-        
-        answer = gemini.generate_response(enhanced_prompt, context)
-        
-        response = {
-            "answer": answer,
-            "sources_used": list(sources_used),
-            "num_documents": len(docs_with_sources),
-            "source_filter": source_filter
-        }
-    else:
-        answer = f"No documents found for your query about '{data.prompt}'" + (f" in source '{source_filter}'" if source_filter else "")
-        response = {
-            "answer": answer,
-            "sources_used": [],
-            "num_documents": 0,
-            "source_filter": source_filter
-        }
-    
+    options = data.retrieval_options()
+    response = await run_coalesced(
+        data.prompt, source_filter, False, options, retrieve_and_answer, data.prompt, source_filter, False, options
+    )
+    if response["answer"] is None:
+        response["answer"] = f"No documents found for your query about '{data.prompt}'" + (f" in source '{source_filter}'" if source_filter else "")
+    response["source_filter"] = source_filter
     return response
@@ -2,10 +2,11 @@ from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 from auth_clerk import get_current_user_id, get_current_user
 from backend.services.web_scraper import scrape_website_async
-from backend.services.document_processor import DocumentProcessor
+from backend.services.document_processor import get_document_processor
+from backend.services.admission import admission, ingest_admission
 
 router = APIRouter()
-doc_processor = DocumentProcessor()
+doc_processor = get_document_processor()
 
 class ScrapeRequest(BaseModel):
     url: str
@@ -13,7 +14,7 @@ class ScrapeRequest(BaseModel):
 @router.post("/scrape")
 async def scrape_endpoint(
     data: ScrapeRequest,
-    user_id: str = Depends(get_current_user_id)
+    user_id: str = Depends(admission(ingest_admission))
 ):
     # Clear all existing documents before scraping new content
     print("🗑️ Clearing existing documents before scraping...")
@@ -1,15 +1,24 @@
-from fastapi import APIRouter, UploadFile, File, Depends
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from typing import List
 from auth_clerk import get_current_user_id, get_current_user
-from backend.services.document_processor import DocumentProcessor
+from backend.services.document_processor import get_document_processor
+from backend.services.admission import admission, ingest_admission, HeldSlotResponse
+import json
 import os
+import shutil
 
 router = APIRouter()
-doc_processor = DocumentProcessor()
+doc_processor = get_document_processor()
+
+# Batch upload limits
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", "100"))
 
 @router.post("/upload")
 async def upload_file(
     file: UploadFile = File(...),
-    user_id: str = Depends(get_current_user_id)
+    user_id: str = Depends(admission(ingest_admission))
 ):
     contents = await file.read()
 
@@ -25,3 +34,59 @@ async def upload_file(
         "filename": file.filename,
         "status": "embedded" if success else "failed"
     }
+
+def save_upload(file, file_path):
+    with open(file_path, "wb") as f:
+        shutil.copyfileobj(file.file, f)
+
+@router.post("/upload/batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Upload many files in one request, streaming one NDJSON line per file as it's embedded"""
+    if len(files) > UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many files: {len(files)} (max {UPLOAD_BATCH_MAX_FILES})"
+        )
+    rejected, accepted, paths = [], [], []
+    for index, file in enumerate(files):
+        filename = os.path.basename(file.filename or "")
+        # Chunk ids are derived from the filename, so a name may only appear once per batch
+        if not filename or f"temp_files/{filename}" in paths:
+            rejected.append({"index": index, "filename": file.filename, "status": "failed",
+                             "chunks": 0, "error": "Missing or duplicate filename"})
+            continue
+        accepted.append(index)
+        paths.append(f"temp_files/{filename}")
+
+    async def stream_results():
+        for result in rejected:
+            yield json.dumps(result) + "\n"
+        if not paths:
+            return
+        results = doc_processor.process_documents(paths)
+        try:
+            async for result in iterate_in_threadpool(results):
+                yield json.dumps({**result, "index": accepted[result["index"]]}) + "\n"
+        finally:
+            # Client went away - stop extracting and embedding the rest
+            await run_in_threadpool(results.close)
+
+    if not paths:
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+    # Each stored file is as much work as an /upload, so the batch costs that many ingest
+    # requests, and it holds one ingest slot (queueing fairly with single uploads) until the
+    # last line is sent. Over the limit this is a plain 429 with Retry-After, like /upload.
+    await ingest_admission.admit_batch(user_id, len(paths))
+    try:
+        os.makedirs("temp_files", exist_ok=True)
+        for index, file_path in zip(accepted, paths):
+            await run_in_threadpool(save_upload, files[index], file_path)
+    except BaseException:
+        if ingest_admission.enabled:
+            ingest_admission.release()
+        raise
+    return HeldSlotResponse(stream_results(), ingest_admission, media_type="application/x-ndjson")
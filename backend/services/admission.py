@@ -0,0 +1,283 @@
+# admission.py
+
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from fastapi import Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from auth_clerk import get_current_user_id
+from backend.services.metrics import record_timing, ADMISSION_DECISIONS, ADMISSION_QUEUE_DEPTH
+
+# Admission control is per worker process, like the metrics
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") == "1"
+ADMISSION_MAX_TRACKED_USERS = int(os.getenv("ADMISSION_MAX_TRACKED_USERS", "10000"))
+# Weighted fair queuing shares, e.g. "user_abc:4,user_xyz:0.5" (everyone else gets 1)
+ADMISSION_USER_WEIGHTS = os.getenv("ADMISSION_USER_WEIGHTS", "")
+
+def parse_weights(spec):
+    weights = {}
+    for item in spec.split(","):
+        user_id, _, weight = item.strip().rpartition(":")
+        if user_id and weight:
+            weights[user_id] = float(weight)
+    return weights
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate          # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost=1):
+        """Take cost tokens; returns 0 on success, otherwise the seconds until they'd be available.
+
+        A cost larger than the whole bucket (a big batch) goes through once the bucket is
+        full and leaves it in debt, so later requests wait until it's paid off.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        needed = min(cost, self.capacity)
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0
+        return (needed - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def refund(self, cost=1):
+        self.tokens = min(self.capacity, self.tokens + cost)
+
+class _Waiter:
+    __slots__ = ("user_id", "future", "cancelled")
+
+    def __init__(self, user_id, future):
+        self.user_id = user_id
+        self.future = future
+        self.cancelled = False
+
+class AdmissionController:
+    """Per-user token buckets in front of a global concurrency budget for one endpoint class.
+
+    Requests over their user's rate are rejected at once with 429 + Retry-After. Admitted
+    requests take one of max_concurrency slots; when none is free they wait in a weighted
+    fair queue (self-clocked: each user's next request is stamped after their previous one,
+    scaled by 1/weight), so a user with many queued requests can't starve the others.
+    A full queue, or a wait longer than max_queue_wait, also ends in a fast 429.
+    """
+
+    def __init__(self, name, rate_per_minute, burst, max_concurrency, max_queue, max_queue_wait,
+                 weights=None, enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self.weights = weights or {}
+        self.active = 0
+        self._buckets = OrderedDict()
+        self._queue = []           # heap of (finish tag, sequence, waiter)
+        self._queued = 0
+        self._virtual_time = 0.0
+        self._last_finish = {}     # user -> finish tag of their latest queued request
+        self._sequence = itertools.count()
+        self._hold_seconds = 1.0   # moving average of slot hold time, for Retry-After estimates
+
+    @classmethod
+    def from_env(cls, name, rate_per_minute, burst, max_concurrency, max_queue, max_queue_wait):
+        """Build a controller whose limits can be overridden by <NAME>_RATE_PER_MINUTE etc."""
+        prefix = name.upper()
+        return cls(
+            name,
+            rate_per_minute=float(os.getenv(f"{prefix}_RATE_PER_MINUTE", rate_per_minute)),
+            burst=float(os.getenv(f"{prefix}_BURST", burst)),
+            max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", max_concurrency)),
+            max_queue=int(os.getenv(f"{prefix}_MAX_QUEUE", max_queue)),
+            max_queue_wait=float(os.getenv(f"{prefix}_MAX_QUEUE_WAIT", max_queue_wait)),
+            weights=parse_weights(ADMISSION_USER_WEIGHTS),
+            enabled=ADMISSION_CONTROL,
+        )
+
+    def _reject(self, reason, retry_after, detail):
+        ADMISSION_DECISIONS.inc(endpoint_class=self.name, result=reason)
+        raise HTTPException(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    def _bucket(self, user_id):
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+            # Forget the least recently seen users; at worst they come back with a full bucket
+            while len(self._buckets) > ADMISSION_MAX_TRACKED_USERS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+        return bucket
+
+    def check_rate(self, user_id, cost=1):
+        wait = self._bucket(user_id).take(cost)
+        if wait:
+            self._reject("rate_limited", wait, f"Rate limit exceeded for {self.name} requests, retry later")
+
+    def _queue_retry_after(self):
+        return self._hold_seconds * (self._queued + 1) / max(1, self.max_concurrency)
+
+    async def acquire(self, user_id, bounded_queue=True):
+        """Take a concurrency slot, waiting in the fair queue if none is free.
+
+        bounded_queue=False ignores max_queue, for work the caller already bounds, like the
+        items of an admitted batch. max_queue_wait always applies.
+        """
+        if self.active < self.max_concurrency and not self._queued:
+            self.active += 1
+            ADMISSION_DECISIONS.inc(endpoint_class=self.name, result="admitted")
+            return
+        if bounded_queue and self._queued >= self.max_queue:
+            self._reject("queue_full", self._queue_retry_after(), f"Too many queued {self.name} requests, retry later")
+
+        weight = self.weights.get(user_id, 1.0)
+        finish = max(self._virtual_time, self._last_finish.get(user_id, 0.0)) + 1.0 / weight
+        self._last_finish[user_id] = finish
+        waiter = _Waiter(user_id, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, (finish, next(self._sequence), waiter))
+        self._queued += 1
+        ADMISSION_QUEUE_DEPTH.set(self._queued, endpoint_class=self.name)
+
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_queue_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release()  # the slot was handed over just as we gave up
+            else:
+                waiter.cancelled = True
+                waiter.future.cancel()
+                self._queued -= 1
+                ADMISSION_QUEUE_DEPTH.set(self._queued, endpoint_class=self.name)
+                self._forget_finish(user_id, finish)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("queue_timeout", self._queue_retry_after(), f"Timed out waiting for a {self.name} slot, retry later")
+            raise
+        finally:
+            record_timing(f"{self.name}_queue", time.perf_counter() - start)
+        ADMISSION_DECISIONS.inc(endpoint_class=self.name, result="queued")
+
+    def _forget_finish(self, user_id, finish):
+        """A waiter gave up: the user's next request shouldn't queue behind work that never ran"""
+        if self._last_finish.get(user_id) != finish:
+            return
+        remaining = [tag for tag, _, waiter in self._queue if waiter.user_id == user_id and not waiter.cancelled]
+        if remaining:
+            self._last_finish[user_id] = max(remaining)
+        else:
+            del self._last_finish[user_id]
+
+    def release(self, held_seconds=None):
+        if held_seconds is not None:
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held_seconds
+        while self._queue:
+            finish, _, waiter = heapq.heappop(self._queue)
+            if waiter.cancelled:
+                continue
+            # The slot passes straight to the next waiter; active stays the same
+            self._virtual_time = finish
+            self._queued -= 1
+            ADMISSION_QUEUE_DEPTH.set(self._queued, endpoint_class=self.name)
+            if self._last_finish.get(waiter.user_id) == finish:
+                del self._last_finish[waiter.user_id]
+            # Tags at or behind the virtual clock no longer change anyone's place in line
+            if len(self._last_finish) > self._queued:
+                for user_id in [u for u, tag in self._last_finish.items() if tag <= finish]:
+                    del self._last_finish[user_id]
+            waiter.future.set_result(None)
+            return
+        self.active -= 1
+
+    async def admit(self, user_id, cost=1):
+        """Rate-check, then take a slot; tokens are refunded if there's no room to queue"""
+        self.check_rate(user_id, cost)
+        try:
+            await self.acquire(user_id)
+        except HTTPException:
+            self._bucket(user_id).refund(cost)
+            raise
+
+    def check_batch(self, user_id, items):
+        """Charge a batch up front as `items` requests against the user's rate limit"""
+        if self.enabled:
+            self.check_rate(user_id, cost=items)
+
+    async def admit_batch(self, user_id, items):
+        """admit() a batch that costs `items` requests and holds one slot; pair with HeldSlotResponse"""
+        if self.enabled:
+            await self.admit(user_id, cost=items)
+
+    @asynccontextmanager
+    async def slot(self, user_id, bounded_queue=True):
+        if not self.enabled:
+            yield
+            return
+        await self.acquire(user_id, bounded_queue)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+class HeldSlotResponse(StreamingResponse):
+    """StreamingResponse that gives back a slot taken with admit_batch() once it's done sending.
+
+    The endpoint's dependencies exit before the body is sent, and a body that never starts
+    (client gone before the first chunk) never runs its own cleanup, so the slot is released
+    around the whole response instead.
+    """
+
+    def __init__(self, content, controller, **kwargs):
+        super().__init__(content, **kwargs)
+        self.controller = controller
+        self.acquired = time.perf_counter()
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.controller.enabled:
+                self.controller.release(time.perf_counter() - self.acquired)
+
+# Defaults: chat is cheap per request but bounded by Gemini quota; ingestion is slow and heavy
+chat_admission = AdmissionController.from_env(
+    "chat", rate_per_minute=30, burst=10, max_concurrency=16, max_queue=64, max_queue_wait=10
+)
+ingest_admission = AdmissionController.from_env(
+    "ingest", rate_per_minute=6, burst=3, max_concurrency=2, max_queue=16, max_queue_wait=30
+)
+
+def admission(controller):
+    """FastAPI dependency enforcing controller's limits for the current user.
+
+    Batch endpoints charge per item with check_batch instead, and endpoints that stream
+    must take their slots inside the body, since the dependency exits before it is sent.
+    """
+    async def dependency(user_id: str = Depends(get_current_user_id)):
+        if not controller.enabled:
+            yield user_id
+            return
+        await controller.admit(user_id)
+        start = time.perf_counter()
+        try:
+            yield user_id
+        finally:
+            controller.release(time.perf_counter() - start)
+    return dependency
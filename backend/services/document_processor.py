@@ -1,29 +1,140 @@
 # document_processor.py
 
 import os
-import PyPDF2
-import docx
-from sentence_transformers import SentenceTransformer
-import chromadb
+import threading
+import time
+from backend.services.embeddings import create_embedding_model
+from backend.services.extraction import extract_text, extract_many
+from backend.services.vector_shards import VECTOR_SHARDING
+from backend.services.vector_index import hnsw_metadata, index_space, open_collection, distances
+from backend.services.mmr import mmr_select, MMR_ENABLED, MMR_LAMBDA, MMR_FETCH_K
+from backend.services.metrics import stage, record_timing, IN_FLIGHT, CHUNKS_EMBEDDED, CHUNKS_PER_SECOND
+
+# flat: search every chunk; hierarchical: pick the closest documents first, then search only their chunks
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "flat")
+RETRIEVAL_TOP_DOCUMENTS = int(os.getenv("RETRIEVAL_TOP_DOCUMENTS", "32"))  # fewer loses recall fast
+# Chunks per encode call when ingesting several files at once
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "64"))
+
+def pooled_embedding(embeddings):
+    """Mean of a document's chunk embeddings, L2-normalised - its vector in the document index"""
+    import numpy as np
+    vector = np.asarray(embeddings, dtype=np.float32).mean(axis=0)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm > 0 else vector).tolist()
 
 class DocumentProcessor:
-    def __init__(self):
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.chroma_client = chromadb.PersistentClient(path="./chroma_db")
-        self.collection = self.chroma_client.get_or_create_collection("documents")
+    def __init__(self, embedding_model=None, chroma_path="./chroma_db", collection_name="documents",
+                 sharding=VECTOR_SHARDING, retrieval_mode=RETRIEVAL_MODE, top_documents=RETRIEVAL_TOP_DOCUMENTS,
+                 index_settings=None):
+        # Any object with a SentenceTransformer-style encode() can be injected (e.g. for benchmarks);
+        # otherwise EMBEDDING_BACKEND picks a local model or the shared embedding server.
+        # The model and Chroma are loaded on first use (or by the startup warm-up), not here.
+        self._embedding_model = embedding_model
+        self.chroma_path = chroma_path
+        self.collection_name = collection_name
+        # "source" keeps one collection per source (see vector_shards.py); "none" uses a single one
+        self.sharded = sharding == "source"
+        self.hierarchical = retrieval_mode == "hierarchical"
+        self.top_documents = top_documents
+        # HNSW_* settings for collections created from here on (see vector_index.py)
+        self.index_settings = hnsw_metadata() if index_settings is None else index_settings
+        self._chroma_client = None
+        self._collection = None
+        self._document_index = None
+        self._init_lock = threading.Lock()
+        # Bumped whenever the corpus changes, so in-flight answers are never shared across a change
+        self.generation = 0
+        self._generation_lock = threading.Lock()
+
+    @property
+    def embedding_model(self):
+        if self._embedding_model is None:
+            with self._init_lock:
+                if self._embedding_model is None:
+                    self._embedding_model = create_embedding_model()
+        return self._embedding_model
+
+    @embedding_model.setter
+    def embedding_model(self, model):
+        self._embedding_model = model
+
+    @property
+    def chroma_client(self):
+        if self._chroma_client is None:
+            with self._init_lock:
+                if self._chroma_client is None:
+                    import chromadb
+                    self._chroma_client = chromadb.PersistentClient(path=self.chroma_path)
+        return self._chroma_client
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            client = self.chroma_client
+            with self._init_lock:
+                if self._collection is None:
+                    if self.sharded:
+                        from backend.services.vector_shards import ShardedCollection
+                        self._collection = ShardedCollection(client, self.collection_name, settings=self.index_settings)
+                    else:
+                        self._collection = open_collection(client, self.collection_name, settings=self.index_settings)
+        return self._collection
+
+    @property
+    def document_index(self):
+        """Coarse index with one pooled embedding per ingested file, used by hierarchical retrieval"""
+        if self._document_index is None:
+            client = self.chroma_client
+            collection = self.collection
+            with self._init_lock:
+                if self._document_index is None:
+                    index = open_collection(client, f"{self.collection_name}-doc-index", settings=self.index_settings)
+                    self._reconcile_document_index(index, collection)
+                    self._document_index = index
+        return self._document_index
+
+    def _reconcile_document_index(self, index, collection):
+        """Bring the document index in line with the stored chunks (it isn't kept up in flat mode)"""
+        if self.sharded:
+            filenames = set()
+            for source_name in collection.sources():
+                metadatas = collection.get(where={"source_name": source_name}, include=['metadatas'])['metadatas']
+                filenames.update(m.get('source') for m in metadatas)
+        else:
+            filenames = {m.get('source') for m in collection.get(include=['metadatas'])['metadatas']}
+        indexed = set(index.get(include=[])['ids'])
+
+        stale = list(indexed - filenames)
+        if stale:
+            index.delete(ids=stale)
+        missing = sorted(filenames - indexed)
+        for filename in missing:
+            chunks = collection.get(where={"source": filename}, include=['embeddings', 'metadatas'])
+            if chunks['ids']:
+                self._index_document(index, filename, chunks['metadatas'][0], chunks['embeddings'])
+        if stale or missing:
+            print(f"🗂️ Document index updated: {len(missing)} added, {len(stale)} removed")
+
+    def _index_document(self, index, filename, metadata, embeddings):
+        index.upsert(
+            ids=[filename],
+            embeddings=[pooled_embedding(embeddings)],
+            metadatas=[{
+                "source": filename,
+                "source_name": metadata.get("source_name", filename),
+                # Chunk ids run from <filename>_0 to <filename>_<total_chunks - 1>
+                "total_chunks": metadata.get("total_chunks", len(embeddings))
+            }]
+        )
+
+    def bump_generation(self):
+        with self._generation_lock:
+            self.generation += 1
+            return self.generation
 
     def extract_text(self, file_path):
-        ext = os.path.splitext(file_path)[1].lower()
-
-        if ext == '.pdf':
-            with open(file_path, 'rb') as file:
-                return "\n".join(page.extract_text() for page in PyPDF2.PdfReader(file).pages)
-        elif ext == '.docx':
-            return "\n".join(p.text for p in docx.Document(file_path).paragraphs)
-        elif ext in ['.txt', '.md']:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
-        return None
+        return extract_text(file_path)
 
     def chunk_text(self, text, size=1000):
         words = text.split()
@@ -40,91 +151,273 @@ class DocumentProcessor:
 
     def process_document(self, file_path):
         try:
-            print(f"📄 Processing document: {file_path}")
-            text = self.extract_text(file_path)
-            if not text: 
-                print(f"❌ No text extracted from: {file_path}")
-                return False
-
-            print(f"📝 Extracted {len(text)} characters, creating chunks...")
-            chunks = self.chunk_text(text)
-            filename = os.path.basename(file_path)
-            source_name = self.get_source_from_filename(filename)
-            
-            print(f"💾 Processing {len(chunks)} chunks for embedding from: {source_name}")
-            for i, chunk in enumerate(chunks):
-                if chunk.strip():
-                    embedding = self.embedding_model.encode(chunk).tolist()
-                    self.collection.add(
-                        documents=[chunk],
-                        embeddings=[embedding],
-                        metadatas=[{
-                            "source": filename,
-                            "source_name": source_name,
-                            "chunk_index": i,
-                            "total_chunks": len(chunks)
-                        }],
-                        ids=[f"{filename}_{i}"]
-                    )
-                if (i + 1) % 10 == 0:  # Progress every 10 chunks
-                    print(f"⏳ Processed {i + 1}/{len(chunks)} chunks...")
-            
-            print(f"✅ Successfully processed document: {filename} ({source_name})")
-            return True
+            with IN_FLIGHT.track_inprogress(component="ingest"):
+                return self._process_document(file_path)
         except Exception as e:
             print("Document processing failed:", e)
             return False
 
-    def query_documents(self, query, n_results=5):
-        try:
-            query_embedding = self.embedding_model.encode(query).tolist()
+    def _process_document(self, file_path):
+        print(f"📄 Processing document: {file_path}")
+        with stage("ingest_extract"):
+            text = self.extract_text(file_path)
+        if not text: 
+            print(f"❌ No text extracted from: {file_path}")
+            return False
+
+        print(f"📝 Extracted {len(text)} characters, creating chunks...")
+        chunks = self.chunk_text(text)
+        filename = os.path.basename(file_path)
+        source_name = self.get_source_from_filename(filename)
+        
+        print(f"💾 Processing {len(chunks)} chunks for embedding from: {source_name}")
+        embed_start = time.perf_counter()
+        embedded = 0
+        embeddings = []
+        for i, chunk in enumerate(chunks):
+            if chunk.strip():
+                embedding = self.embedding_model.encode(chunk).tolist()
+                embeddings.append(embedding)
+                self.collection.add(
+                    documents=[chunk],
+                    embeddings=[embedding],
+                    metadatas=[{
+                        "source": filename,
+                        "source_name": source_name,
+                        "chunk_index": i,
+                        "total_chunks": len(chunks)
+                    }],
+                    ids=[f"{filename}_{i}"]
+                )
+                embedded += 1
+            if (i + 1) % 10 == 0:  # Progress every 10 chunks
+                print(f"⏳ Processed {i + 1}/{len(chunks)} chunks...")
+        
+        if self.hierarchical and embeddings:
+            self._index_document(
+                self.document_index, filename, {"source_name": source_name, "total_chunks": len(chunks)}, embeddings
+            )
+        if embedded:
+            self.bump_generation()
+        embed_seconds = time.perf_counter() - embed_start
+        record_timing("ingest_embed", embed_seconds)
+        CHUNKS_EMBEDDED.inc(embedded)
+        if embedded and embed_seconds > 0:
+            CHUNKS_PER_SECOND.observe(embedded / embed_seconds)
+        
+        print(f"✅ Successfully processed document: {filename} ({source_name})")
+        return True
+
+    def process_documents(self, file_paths, batch_size=INGEST_EMBED_BATCH_SIZE):
+        """Ingest many files at once; yields one result per file, in the order they finish.
+
+        Text is extracted in parallel worker processes (see extraction.py) and chunks
+        from all files are embedded and stored together, batch_size at a time. A file's
+        result comes out once all of its chunks are stored.
+        """
+        with IN_FLIGHT.track_inprogress(component="ingest"):
+            yield from self._process_documents(file_paths, batch_size)
+
+    def _process_documents(self, file_paths, batch_size):
+        files = {}    # index -> progress of a file whose chunks are still being embedded
+        pending = []  # (file index, chunk index, chunk) waiting for the next batch
+
+        def result(index, status, chunks=0, error=None):
+            filename = os.path.basename(file_paths[index])
+            row = {"index": index, "filename": filename, "status": status, "chunks": chunks}
+            if error:
+                row["error"] = error
+            return row
+
+        def finished():
+            for index in [i for i, f in files.items() if f["remaining"] == 0]:
+                f = files.pop(index)
+                if f["error"]:
+                    yield result(index, "failed", f["stored"], f["error"])
+                    continue
+                if self.hierarchical and f["embeddings"]:
+                    self._index_document(self.document_index, f["filename"],
+                                         {"source_name": f["source_name"], "total_chunks": f["total"]}, f["embeddings"])
+                print(f"✅ Successfully processed document: {f['filename']} ({f['source_name']})")
+                yield result(index, "embedded", f["stored"])
+
+        def flush(batch):
+            start = time.perf_counter()
+            try:
+                embeddings = self.embedding_model.encode([chunk for _, _, chunk in batch]).tolist()
+                self.collection.add(
+                    documents=[chunk for _, _, chunk in batch],
+                    embeddings=embeddings,
+                    metadatas=[{
+                        "source": files[index]["filename"],
+                        "source_name": files[index]["source_name"],
+                        "chunk_index": i,
+                        "total_chunks": files[index]["total"]
+                    } for index, i, _ in batch],
+                    ids=[f"{files[index]['filename']}_{i}" for index, i, _ in batch]
+                )
+            except Exception as e:
+                print("Batch embedding failed:", e)
+                for index, _, _ in batch:
+                    files[index]["error"] = f"Embedding failed: {e}"
+                    files[index]["remaining"] -= 1
+                return
+            seconds = time.perf_counter() - start
+            record_timing("ingest_embed", seconds)
+            CHUNKS_EMBEDDED.inc(len(batch))
+            if seconds > 0:
+                CHUNKS_PER_SECOND.observe(len(batch) / seconds)
+            for (index, _, _), embedding in zip(batch, embeddings):
+                files[index]["embeddings"].append(embedding)
+                files[index]["stored"] += 1
+                files[index]["remaining"] -= 1
+            self.bump_generation()
+
+        for index, text, error, seconds in extract_many(file_paths):
+            record_timing("ingest_extract", seconds)
+            if not text:
+                print(f"❌ No text extracted from: {file_paths[index]}")
+                yield result(index, "failed", error=error or "No text extracted")
+                continue
+            all_chunks = self.chunk_text(text)
+            chunks = [(i, chunk) for i, chunk in enumerate(all_chunks) if chunk.strip()]
+            filename = os.path.basename(file_paths[index])
+            files[index] = {
+                "filename": filename,
+                "source_name": self.get_source_from_filename(filename),
+                "total": len(all_chunks),
+                "remaining": len(chunks),
+                "stored": 0,
+                "embeddings": [],
+                "error": None,
+            }
+            pending.extend((index, i, chunk) for i, chunk in chunks)
+            print(f"💾 {filename}: {len(chunks)} chunks queued for embedding")
+            while len(pending) >= batch_size:
+                batch, pending = pending[:batch_size], pending[batch_size:]
+                flush(batch)
+            yield from finished()
+
+        while pending:
+            batch, pending = pending[:batch_size], pending[batch_size:]
+            flush(batch)
+        yield from finished()
+
+    def _format_results(self, documents, metadatas):
+        """Pair each retrieved chunk with its source information"""
+        docs_with_sources = []
+        for doc, metadata in zip(documents, metadatas):
+            docs_with_sources.append({
+                'content': doc,
+                'source': metadata.get('source_name', metadata.get('source', 'Unknown')),
+                'filename': metadata.get('source', 'Unknown')
+            })
+        return docs_with_sources
+
+    def _search(self, query_embeddings, n_results, source_filter=None, mmr=None, mmr_lambda=None, fetch_k=None):
+        """Vector search for each query embedding; returns one list of formatted chunks per query.
+
+        With mmr, fetch_k candidates are over-fetched and n_results of them picked for
+        diversity (see mmr.py); None falls back to the MMR_* settings.
+        """
+        mmr = MMR_ENABLED if mmr is None else mmr
+        mmr_lambda = MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+        fetch = max(fetch_k or MMR_FETCH_K, n_results) if mmr else n_results
+        source_where = {"source_name": {"$eq": source_filter}} if source_filter else None
+        if self.hierarchical:
+            return self._search_hierarchical(query_embeddings, n_results, source_where, mmr, mmr_lambda, fetch)
+
+        with stage("vector_query"):
             results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results,
-                include=['documents', 'metadatas']
+                query_embeddings=query_embeddings,
+                n_results=fetch,
+                where=source_where,
+                include=['documents', 'metadatas', 'embeddings'] if mmr else ['documents', 'metadatas']
             )
-            
+        if not (results['documents'] and results['metadatas']):
+            return [[] for _ in query_embeddings]
+
+        found = []
+        for q, (documents, metadatas) in enumerate(zip(results['documents'], results['metadatas'])):
+            if mmr:
+                documents, metadatas = self._diversify(
+                    query_embeddings[q], results['embeddings'][q], documents, metadatas, n_results, mmr_lambda
+                )
             # Return both documents and their sources for better context
-            if results['documents'] and results['metadatas']:
-                docs_with_sources = []
-                for doc, metadata in zip(results['documents'][0], results['metadatas'][0]):
-                    docs_with_sources.append({
-                        'content': doc,
-                        'source': metadata.get('source_name', metadata.get('source', 'Unknown')),
-                        'filename': metadata.get('source', 'Unknown')
-                    })
-                return docs_with_sources
+            found.append(self._format_results(documents, metadatas))
+        return found
+
+    def _diversify(self, query_embedding, embeddings, documents, metadatas, n_results, mmr_lambda):
+        with stage("mmr"):
+            picked = mmr_select(query_embedding, embeddings, n_results, mmr_lambda)
+        return [documents[i] for i in picked], [metadatas[i] for i in picked]
+
+    def _search_hierarchical(self, query_embeddings, n_results, source_where, mmr=False, mmr_lambda=MMR_LAMBDA, fetch=None):
+        """Find the top documents by pooled embedding, then rank only those documents' chunks"""
+        import numpy as np
+        with stage("document_query"):
+            document_hits = self.document_index.query(
+                query_embeddings=query_embeddings,
+                n_results=self.top_documents,
+                where=source_where,
+                include=['metadatas']
+            )['metadatas']
+
+        found = []
+        with stage("vector_query"):
+            for query_embedding, documents in zip(query_embeddings, document_hits):
+                # Chunk ids are "<filename>_<index>", so candidates are fetched by id: a metadata
+                # filter over the whole collection would cost more than the flat search itself
+                ids_by_source = {}
+                for document in documents:
+                    ids_by_source.setdefault(document['source_name'], []).extend(
+                        f"{document['source']}_{i}" for i in range(document['total_chunks'])
+                    )
+                texts, metadatas, embeddings = [], [], []
+                for source_name, ids in ids_by_source.items():
+                    chunks = self.collection.get(
+                        ids=ids,
+                        where={"source_name": {"$eq": source_name}} if self.sharded else None,
+                        include=['documents', 'metadatas', 'embeddings']
+                    )
+                    texts.extend(chunks['documents'])
+                    metadatas.extend(chunks['metadatas'])
+                    embeddings.extend(chunks['embeddings'])
+                if not texts:
+                    found.append([])
+                    continue
+                # Exact ranking (in the index's distance space) within the candidate documents
+                scores = distances(index_space(self.index_settings), query_embedding, embeddings)
+                top = np.argsort(scores, kind="stable")[:fetch or n_results]
+                texts, metadatas = [texts[i] for i in top], [metadatas[i] for i in top]
+                if mmr:
+                    texts, metadatas = self._diversify(
+                        query_embedding, [embeddings[i] for i in top], texts, metadatas, n_results, mmr_lambda
+                    )
+                found.append(self._format_results(texts, metadatas))
+        return found
+
+    def query_documents(self, query, n_results=5, **retrieval_options):
+        return self.query_documents_by_source(query, n_results=n_results, **retrieval_options)
+
+    def query_documents_batch(self, queries, n_results=5, source_filter=None, **retrieval_options):
+        """Query documents for many prompts with one encode call and one vector search"""
+        if not queries:
             return []
+        try:
+            with stage("query_encode"):
+                query_embeddings = self.embedding_model.encode(list(queries)).tolist()
+            return self._search(query_embeddings, n_results, source_filter, **retrieval_options)
         except Exception as e:
-            print("Query failed:", e)
-            return []
+            print("Batch query failed:", e)
+            return [[] for _ in queries]
 
-    def query_documents_by_source(self, query, source_filter=None, n_results=5):
+    def query_documents_by_source(self, query, source_filter=None, n_results=5, **retrieval_options):
         """Query documents with optional source filtering"""
         try:
-            query_embedding = self.embedding_model.encode(query).tolist()
-            
-            where_clause = {}
-            if source_filter:
-                where_clause = {"source_name": {"$eq": source_filter}}
-            
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results,
-                where=where_clause if where_clause else None,
-                include=['documents', 'metadatas']
-            )
-            
-            if results['documents'] and results['metadatas']:
-                docs_with_sources = []
-                for doc, metadata in zip(results['documents'][0], results['metadatas'][0]):
-                    docs_with_sources.append({
-                        'content': doc,
-                        'source': metadata.get('source_name', metadata.get('source', 'Unknown')),
-                        'filename': metadata.get('source', 'Unknown')
-                    })
-                return docs_with_sources
-            return []
+            with stage("query_encode"):
+                query_embedding = self.embedding_model.encode(query).tolist()
+            return self._search([query_embedding], n_results, source_filter, **retrieval_options)[0]
         except Exception as e:
             print("Query failed:", e)
             return []
@@ -132,6 +425,8 @@ class DocumentProcessor:
     def get_available_sources(self):
         """Get list of available document sources"""
         try:
+            if self.sharded:
+                return self.collection.sources()
             # Get all documents to find unique sources
             results = self.collection.get(include=['metadatas'])
             sources = set()
@@ -143,14 +438,27 @@ class DocumentProcessor:
             print("Failed to get sources:", e)
             return []
 
+    def _unindex_documents(self, where=None):
+        ids = self.document_index.get(where=where, include=[])['ids']
+        if ids:
+            self.document_index.delete(ids=ids)
+
     def clear_all_documents(self):
         """Clear all documents from the collection"""
         try:
+            if self.hierarchical:
+                self._unindex_documents()
+            if self.sharded:
+                cleared = self.collection.drop_all()
+                self.bump_generation()
+                print(f"✅ Cleared {cleared} documents from database")
+                return True
             # Get all document IDs
             results = self.collection.get()
             if results['ids']:
                 # Delete all documents
                 self.collection.delete(ids=results['ids'])
+                self.bump_generation()
                 print(f"✅ Cleared {len(results['ids'])} documents from database")
                 return True
             else:
@@ -163,14 +471,22 @@ class DocumentProcessor:
     def clear_documents_by_source(self, source_name):
         """Clear documents from a specific source"""
         try:
+            if self.hierarchical:
+                self._unindex_documents({"source_name": {"$eq": source_name}})
+            if self.sharded:
+                cleared = self.collection.drop_source(source_name)
+                self.bump_generation()
+                print(f"✅ Cleared {cleared} documents from source: {source_name}")
+                return True
             # Get documents from specific source
             results = self.collection.get(
                 where={"source_name": {"$eq": source_name}},
-                include=['ids']
+                include=[]  # ids are always returned; 'ids' itself isn't a valid include
             )
             if results['ids']:
                 # Delete documents from this source
                 self.collection.delete(ids=results['ids'])
+                self.bump_generation()
                 print(f"✅ Cleared {len(results['ids'])} documents from source: {source_name}")
                 return True
             else:
@@ -178,4 +494,16 @@ class DocumentProcessor:
                 return True
         except Exception as e:
             print(f"❌ Failed to clear documents from {source_name}: {e}")
-            return False
\ No newline at end of file
+            return False
+
+_shared_processor = None
+_shared_lock = threading.Lock()
+
+def get_document_processor():
+    """Process-wide DocumentProcessor shared by all routes (one model, one Chroma client)"""
+    global _shared_processor
+    if _shared_processor is None:
+        with _shared_lock:
+            if _shared_processor is None:
+                _shared_processor = DocumentProcessor()
+    return _shared_processor
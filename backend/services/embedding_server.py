@@ -0,0 +1,293 @@
+"""Shared embedding service: one model per host, micro-batched across all API workers.
+
+Every uvicorn worker otherwise loads its own model copy and runs batch-of-1 encodes
+for concurrent queries. This server holds a single model and coalesces concurrent
+requests from all workers into micro-batches bounded by a max batch size and a max
+wait, so memory stays flat as workers are added and throughput rises under load.
+
+Run it next to the API and point the workers at it:
+
+    python -m backend.services.embedding_server --address unix:///tmp/rag-embeddings.sock
+    EMBEDDING_BACKEND=server uvicorn main:app --workers 4
+
+Wire format (per request on a persistent connection), every frame is a 4-byte
+big-endian length followed by the payload:
+    request:  JSON {"texts": [...]}
+    response: JSON {"shape": [n, dim], "dtype": "float32"} then the raw vector bytes,
+              or JSON {"error": "..."}
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+
+EMBEDDING_SERVER_ADDRESS = os.getenv("EMBEDDING_SERVER_ADDRESS", "unix:///tmp/rag-embeddings.sock")
+EMBEDDING_SERVER_TIMEOUT = float(os.getenv("EMBEDDING_SERVER_TIMEOUT", "30"))
+EMBEDDING_SERVER_POOL_SIZE = int(os.getenv("EMBEDDING_SERVER_POOL_SIZE", "8"))
+# Load a local model if the server is unreachable instead of failing every encode. Off by
+# default: with many workers that means one model copy each, which the server is there to avoid
+EMBEDDING_SERVER_FALLBACK = os.getenv("EMBEDDING_SERVER_FALLBACK", "0") == "1"
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "64"))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+
+_HEADER = struct.Struct(">I")
+# The server is down or restarted (not merely slow): worth a reconnect, or the local fallback.
+# Timeouts are deliberately excluded - repeating work an overloaded server hasn't finished only adds load.
+_UNREACHABLE = (ConnectionError, FileNotFoundError)
+
+def parse_address(address):
+    """'unix:///path.sock' -> (AF_UNIX, path); 'tcp://host:port' -> (AF_INET, (host, port))"""
+    if address.startswith("unix://"):
+        return socket.AF_UNIX, address[len("unix://"):]
+    if address.startswith("tcp://"):
+        host, _, port = address[len("tcp://"):].rpartition(":")
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    raise ValueError(f"Unsupported embedding server address: {address}")
+
+# ---------------------------------------------------------------- client side
+
+def _recv_exact(sock, size):
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            raise ConnectionError("Embedding server closed the connection")
+        buffer += chunk
+    return bytes(buffer)
+
+def _send_frame(sock, payload):
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+def _recv_frame(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return _recv_exact(sock, size)
+
+class EmbeddingClient:
+    """Thread-safe client with a SentenceTransformer-compatible encode()"""
+
+    def __init__(self, address=EMBEDDING_SERVER_ADDRESS, timeout=EMBEDDING_SERVER_TIMEOUT,
+                 pool_size=EMBEDDING_SERVER_POOL_SIZE, fallback=EMBEDDING_SERVER_FALLBACK):
+        self.address = address
+        self.family, self.target = parse_address(address)
+        self.timeout = timeout
+        self.fallback = fallback
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._fallback_model = None
+        self._fallback_lock = threading.Lock()
+        self._dimension = None
+
+    def _connect(self):
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.target)
+        return sock
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _release(self, sock):
+        try:
+            self._pool.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+
+    def _roundtrip(self, sock, texts):
+        _send_frame(sock, json.dumps({"texts": texts}).encode("utf-8"))
+        header = json.loads(_recv_frame(sock))
+        if "error" in header:
+            raise RuntimeError(f"Embedding server error: {header['error']}")
+        data = _recv_frame(sock)
+        vectors = np.frombuffer(data, dtype=header["dtype"]).reshape(header["shape"])
+        self._dimension = vectors.shape[1]
+        return vectors
+
+    def _request(self, texts):
+        # A pooled connection may have gone stale (server restart) - retry once on a fresh one
+        for attempt in range(2):
+            sock = self._acquire() if attempt == 0 else self._connect()
+            try:
+                vectors = self._roundtrip(sock, texts)
+            except _UNREACHABLE:
+                sock.close()
+                if attempt == 1:
+                    raise
+                continue
+            except BaseException:
+                # e.g. a timeout: the reply may still arrive later, so the connection can't be reused
+                sock.close()
+                raise
+            self._release(sock)
+            return vectors
+
+    def _encode_fallback(self, texts, **kwargs):
+        with self._fallback_lock:
+            if self._fallback_model is None:
+                print(f"⚠️ Embedding server unreachable at {self.address}, loading a local model")
+                from backend.services.embeddings import create_embedding_model
+                self._fallback_model = create_embedding_model("local")
+        vectors = np.asarray(self._fallback_model.encode(texts, **kwargs), dtype=np.float32)
+        self._dimension = vectors.shape[1]
+        return vectors
+
+    def get_sentence_embedding_dimension(self):
+        if self._dimension is None:
+            self.encode([""])
+        return self._dimension
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, convert_to_numpy=True, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            # Same (0, dim) shape a local model returns
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        try:
+            vectors = self._request(texts)
+        except _UNREACHABLE:
+            if not self.fallback:
+                raise
+            vectors = self._encode_fallback(texts, batch_size=batch_size)
+        return vectors[0] if single else vectors
+
+# ---------------------------------------------------------------- server side
+
+class MicroBatcher:
+    """Coalesces concurrent encode requests into batches of up to max_batch_size texts"""
+
+    def __init__(self, model, max_batch_size=EMBEDDING_MAX_BATCH_SIZE, max_wait=EMBEDDING_MAX_WAIT_MS / 1000):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        # One inference thread: the model is the bottleneck, the event loop keeps collecting requests
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        self.batches = 0
+        self.texts = 0
+
+    async def encode(self, texts):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            count = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while count < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                count += len(item[0])
+
+            all_texts = [text for texts, _ in batch for text in texts]
+            try:
+                vectors = await loop.run_in_executor(
+                    self.executor,
+                    partial(self.model.encode, all_texts, batch_size=self.max_batch_size, convert_to_numpy=True)
+                )
+                vectors = np.asarray(vectors, dtype=np.float32)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.texts += len(all_texts)
+            offset = 0
+            for texts, future in batch:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(texts)])
+                offset += len(texts)
+
+class EmbeddingServer:
+    def __init__(self, model, address=EMBEDDING_SERVER_ADDRESS, **batcher_options):
+        self.address = address
+        self.batcher = MicroBatcher(model, **batcher_options)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                    request = json.loads(await reader.readexactly(size))
+                except asyncio.IncompleteReadError:
+                    break
+                try:
+                    vectors = await self.batcher.encode(request["texts"])
+                    header = {"shape": list(vectors.shape), "dtype": str(vectors.dtype)}
+                    body = vectors.tobytes()
+                except Exception as e:
+                    header, body = {"error": str(e)}, None
+                payload = json.dumps(header).encode("utf-8")
+                writer.write(_HEADER.pack(len(payload)) + payload)
+                if body is not None:
+                    writer.write(_HEADER.pack(len(body)) + body)
+                await writer.drain()
+        except ConnectionError:
+            pass  # the client gave up (e.g. timed out) before its reply was written
+        finally:
+            writer.close()
+
+    async def serve(self):
+        family, target = parse_address(self.address)
+        if family == socket.AF_UNIX:
+            if os.path.exists(target):
+                os.unlink(target)
+            server = await asyncio.start_unix_server(self._handle, path=target)
+        else:
+            server = await asyncio.start_server(self._handle, host=target[0], port=target[1])
+        batcher_task = asyncio.create_task(self.batcher.run())
+        print(f"✅ Embedding server listening on {self.address} "
+              f"(max batch {self.batcher.max_batch_size}, max wait {self.batcher.max_wait * 1000:.1f} ms)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher_task.cancel()
+            if family == socket.AF_UNIX and os.path.exists(target):
+                os.unlink(target)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared micro-batching embedding server")
+    parser.add_argument("--address", default=EMBEDDING_SERVER_ADDRESS, help="unix:///path.sock or tcp://host:port")
+    parser.add_argument("--backend", default=os.getenv("EMBEDDING_SERVER_BACKEND", "local"), help="model backend to serve")
+    parser.add_argument("--max-batch-size", type=int, default=EMBEDDING_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=EMBEDDING_MAX_WAIT_MS)
+    args = parser.parse_args(argv)
+    if args.backend == "server":
+        parser.error("the embedding server cannot use the 'server' backend itself")
+
+    from backend.services.embeddings import create_embedding_model
+    start = time.perf_counter()
+    model = create_embedding_model(args.backend)
+    model.encode("warm up")
+    print(f"🧠 Loaded {args.backend} embedding model in {time.perf_counter() - start:.1f}s")
+
+    server = EmbeddingServer(model, args.address, max_batch_size=args.max_batch_size, max_wait=args.max_wait_ms / 1000)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
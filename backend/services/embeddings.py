@@ -0,0 +1,24 @@
+# embeddings.py
+
+import os
+
+# Which embedding implementation DocumentProcessor uses:
+#   local  - SentenceTransformer loaded in this process
+#   server - shared micro-batching embedding server (see embedding_server.py)
+#   onnx   - ONNX Runtime, optionally int8-quantized, no torch at runtime (see onnx_embedder.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "local")
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+
+def create_embedding_model(backend=None):
+    """Build the configured embedding model; all backends expose SentenceTransformer-style encode()"""
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    if backend == "local":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(EMBEDDING_MODEL_NAME)
+    if backend == "server":
+        from backend.services.embedding_server import EmbeddingClient
+        return EmbeddingClient()
+    if backend == "onnx":
+        from backend.services.onnx_embedder import OnnxEmbedder
+        return OnnxEmbedder(EMBEDDING_MODEL_NAME)
+    raise ValueError(f"❌ Unknown EMBEDDING_BACKEND: {backend}")
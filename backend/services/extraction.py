@@ -0,0 +1,90 @@
+# extraction.py
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+# Worker processes for batch uploads: PDF/DOCX parsing is pure Python and holds the GIL,
+# so threads don't help. 0 = min(4, CPU count); 1 = extract in the calling thread.
+INGEST_EXTRACT_WORKERS = int(os.getenv("INGEST_EXTRACT_WORKERS", "0"))
+
+def extract_text(file_path):
+    """Plain text of a PDF, DOCX, TXT or MD file; None for other types"""
+    ext = os.path.splitext(file_path)[1].lower()
+
+    if ext == '.pdf':
+        import PyPDF2
+        with open(file_path, 'rb') as file:
+            return "\n".join(page.extract_text() for page in PyPDF2.PdfReader(file).pages)
+    elif ext == '.docx':
+        import docx
+        return "\n".join(p.text for p in docx.Document(file_path).paragraphs)
+    elif ext in ['.txt', '.md']:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return file.read()
+    return None
+
+def _timed_extract(file_path):
+    start = time.perf_counter()
+    return extract_text(file_path), time.perf_counter() - start
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _worker_count():
+    return INGEST_EXTRACT_WORKERS or min(4, os.cpu_count() or 1)
+
+def extraction_pool():
+    """Process pool shared by all batch uploads, started on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn, not fork: forking a process that runs threads (uvicorn, Chroma) can deadlock
+                _pool = ProcessPoolExecutor(max_workers=_worker_count(),
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+def extract_many(file_paths):
+    """Extract files in parallel; yields (index, text, error, seconds) in completion order"""
+    if _worker_count() <= 1 or len(file_paths) <= 1:
+        for index, file_path in enumerate(file_paths):
+            yield (index, *_extract_here(file_path))
+        return
+
+    futures = {extraction_pool().submit(_timed_extract, path): index for index, path in enumerate(file_paths)}
+    try:
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                text, seconds = future.result()
+                yield index, text, None, seconds
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory on a huge PDF); retry this file here
+                _reset_pool()
+                yield (index, *_extract_here(file_paths[index]))
+            except Exception as e:
+                yield index, None, str(e), 0.0
+    finally:
+        for future in futures:
+            future.cancel()
+
+def _extract_here(file_path):
+    start = time.perf_counter()
+    try:
+        return extract_text(file_path), None, time.perf_counter() - start
+    except Exception as e:
+        return None, str(e), time.perf_counter() - start
+
+def shutdown():
+    _reset_pool()
@@ -1,8 +1,10 @@
 # gemini_client.py
 
-import google.generativeai as genai
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from backend.services.metrics import record_timing, IN_FLIGHT
 
 load_dotenv()  # Load environment variables from .env file
 
@@ -12,8 +14,19 @@ class GeminiClient:
         if not self.api_key:
             raise ValueError("❌ GEMINI_API_KEY not found in .env file.")
         
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel("gemini-2.0-flash")
+        # google.generativeai is imported on first use (or by the startup warm-up)
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel("gemini-2.0-flash")
+        return self._model
 
     def generate_response(self, prompt, context=""):
         full_prompt = f"""
@@ -29,7 +42,17 @@ Answer in 2-3 clear sentences.
 """
 
         try:
-            response = self.model.generate_content(full_prompt)
-            return response.text.strip()
+            # Stream so time-to-first-token can be measured separately from the full answer
+            with IN_FLIGHT.track_inprogress(component="llm"):
+                start = time.perf_counter()
+                parts = []
+                try:
+                    for chunk in self.model.generate_content(full_prompt, stream=True):
+                        if not parts:
+                            record_timing("llm_ttft", time.perf_counter() - start)
+                        parts.append(chunk.text)
+                finally:
+                    record_timing("llm_total", time.perf_counter() - start)
+            return "".join(parts).strip()
         except Exception as e:
             return f"❌ Gemini Error: {e}"
\ No newline at end of file
@@ -0,0 +1,44 @@
+# mmr.py
+
+import os
+
+# Maximal marginal relevance defaults; the chat endpoints can override them per request
+MMR_ENABLED = os.getenv("MMR_ENABLED", "0") == "1"
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))  # 1 = pure relevance, 0 = pure diversity
+MMR_FETCH_K = int(os.getenv("MMR_FETCH_K", "20"))    # candidates over-fetched before selecting
+
+def _normalize(vectors):
+    import numpy as np
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+def mmr_select(query_embedding, candidate_embeddings, k, lambda_mult=MMR_LAMBDA):
+    """Pick k candidates that are relevant to the query but not redundant with each other.
+
+    Greedy MMR: each step takes argmax of lambda * sim(query, c) - (1 - lambda) * max sim(c, selected).
+    All similarities come from two matrix products up front; each of the k steps is one
+    vectorised update of the running max-similarity-to-selected. Returns candidate indices
+    in selection order.
+    """
+    import numpy as np
+    candidates = _normalize(candidate_embeddings)
+    n = len(candidates)
+    if n == 0 or k <= 0:
+        return []
+    k = min(k, n)
+    relevance = candidates @ _normalize(query_embedding)
+    similarity = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    for _ in range(k - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
@@ -0,0 +1,226 @@
+"""ONNX Runtime embedding backend for CPU-only nodes.
+
+Exports the sentence-transformers model to ONNX once (optionally dynamically
+int8-quantized) and serves it with ONNX Runtime using a fast `tokenizers`
+tokenizer, so the API process never imports torch. Pooling and normalisation
+match the original model, and check_parity() verifies cosine agreement.
+
+    python -m backend.services.onnx_embedder --export --quantize --check
+    EMBEDDING_BACKEND=onnx uvicorn main:app
+"""
+
+import argparse
+import inspect
+import json
+import os
+import time
+
+import numpy as np
+
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "./onnx_models")
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "0") == "1"
+# 0 lets ONNX Runtime pick (all physical cores); set lower when running several workers per host
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+CONFIG_FILE = "embedding_config.json"
+
+def model_dir_for(model_name, base_dir=ONNX_MODEL_DIR):
+    return os.path.join(base_dir, model_name.replace("/", "__"))
+
+def export_onnx(model_name, output_dir, quantize=False, opset=14):
+    """Export a sentence-transformers model to ONNX (needs torch; run once, offline of serving)"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    os.makedirs(output_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    tokenizer.save_pretrained(output_dir)
+
+    pooling = next((m for m in st_model if isinstance(m, Pooling)), None)
+    if pooling is not None and not pooling.get_config_dict().get("pooling_mode_mean_tokens", False):
+        raise ValueError("❌ Only mean-pooling sentence-transformers models can be exported")
+    config = {
+        "model_name": model_name,
+        "max_seq_length": st_model.get_max_seq_length() or 256,
+        "normalize": any(isinstance(m, Normalize) for m in st_model),
+        "dimension": st_model.get_sentence_embedding_dimension(),
+    }
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    model_path = os.path.join(output_dir, MODEL_FILE)
+    export_options = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # Newer torch defaults to the dynamo exporter; the TorchScript one handles dynamic_axes directly
+        export_options["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+            **export_options,
+        )
+    print(f"✅ Exported {model_name} to {model_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantized_path = os.path.join(output_dir, QUANTIZED_MODEL_FILE)
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        print(f"✅ Wrote int8-quantized model to {quantized_path}")
+
+    with open(os.path.join(output_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    return output_dir
+
+class OnnxEmbedder:
+    """SentenceTransformer-compatible encode() on ONNX Runtime"""
+
+    def __init__(self, model_name=None, model_dir=None, quantized=ONNX_QUANTIZE,
+                 intra_op_threads=ONNX_INTRA_OP_THREADS, export_if_missing=True):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        if model_name is None:
+            from backend.services.embeddings import EMBEDDING_MODEL_NAME
+            model_name = EMBEDDING_MODEL_NAME
+        self.model_dir = model_dir or model_dir_for(model_name)
+        model_file = QUANTIZED_MODEL_FILE if quantized else MODEL_FILE
+        model_path = os.path.join(self.model_dir, model_file)
+        if not os.path.exists(model_path):
+            if not export_if_missing:
+                raise FileNotFoundError(f"❌ No exported ONNX model at {model_path}")
+            print(f"📦 No ONNX model at {model_path}, exporting {model_name}...")
+            export_onnx(model_name, self.model_dir, quantize=quantized)
+
+        with open(os.path.join(self.model_dir, CONFIG_FILE), encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.max_seq_length = self.config["max_seq_length"]
+        self.normalize = self.config["normalize"]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        pad_token = self._pad_token()
+        pad_id = self.tokenizer.token_to_id(pad_token)
+        self.tokenizer.enable_padding(pad_id=pad_id if pad_id is not None else 0, pad_token=pad_token)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _pad_token(self):
+        special_tokens_path = os.path.join(self.model_dir, "special_tokens_map.json")
+        if os.path.exists(special_tokens_path):
+            with open(special_tokens_path, encoding="utf-8") as f:
+                pad_token = json.load(f).get("pad_token")
+            if isinstance(pad_token, dict):
+                pad_token = pad_token.get("content")
+            if pad_token:
+                return pad_token
+        return "[PAD]"
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dimension"]
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+
+        # Mean pooling over real tokens, as the sentence-transformers Pooling layer does
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, convert_to_numpy=True, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # Sort by length so each batch pads to a similar size, then restore the input order
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        vectors = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            index = order[start:start + batch_size]
+            vectors[index] = self._encode_batch([texts[i] for i in index])
+        return vectors[0] if single else vectors
+
+def check_parity(reference_model, candidate_model, sentences, min_cosine=0.99):
+    """Compare embeddings from two models; returns cosine stats and whether they agree"""
+    reference = np.asarray(reference_model.encode(sentences), dtype=np.float32)
+    candidate = np.asarray(candidate_model.encode(sentences), dtype=np.float32)
+    reference /= np.clip(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12, None)
+    candidate /= np.clip(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12, None)
+    cosines = (reference * candidate).sum(axis=1)
+    return {
+        "sentences": len(sentences),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "threshold": min_cosine,
+        "ok": bool(cosines.min() >= min_cosine),
+    }
+
+PARITY_SENTENCES = [
+    "How do I reset my password?",
+    "The vector index returns the five nearest chunks for every query.",
+    "Clerk rotates signing keys and publishes them in the JWKS document.",
+    "Scraped pages have their navigation, header and footer removed before chunking.",
+    "Gemini answers in two or three clear sentences using the retrieved context.",
+    "短い日本語の文も正しく埋め込まれるべきです。",
+    "a",
+    " ".join(["long input that exceeds the maximum sequence length"] * 80),
+]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and verify the ONNX embedding backend")
+    parser.add_argument("--model", default=None, help="sentence-transformers model name (default: EMBEDDING_MODEL_NAME)")
+    parser.add_argument("--output", default=None, help="export directory (default: ONNX_MODEL_DIR/<model>)")
+    parser.add_argument("--export", action="store_true", help="(re-)export the model")
+    parser.add_argument("--quantize", action="store_true", help="also write / use the int8-quantized model")
+    parser.add_argument("--check", action="store_true", help="verify cosine parity against the PyTorch model")
+    parser.add_argument("--min-cosine", type=float, default=None, help="parity threshold (default 0.999 fp32, 0.98 int8)")
+    args = parser.parse_args(argv)
+
+    from backend.services.embeddings import EMBEDDING_MODEL_NAME
+    model_name = args.model or EMBEDDING_MODEL_NAME
+    output_dir = args.output or model_dir_for(model_name)
+    if args.export:
+        export_onnx(model_name, output_dir, quantize=args.quantize)
+    if args.check:
+        from sentence_transformers import SentenceTransformer
+        reference = SentenceTransformer(model_name, device="cpu")
+        candidate = OnnxEmbedder(model_name, model_dir=output_dir, quantized=args.quantize)
+        threshold = args.min_cosine or (0.98 if args.quantize else 0.999)
+        start = time.perf_counter()
+        result = check_parity(reference, candidate, PARITY_SENTENCES, min_cosine=threshold)
+        result["seconds"] = time.perf_counter() - start
+        print(json.dumps(result, indent=2))
+        if not result["ok"]:
+            raise SystemExit(f"❌ ONNX embeddings diverge from PyTorch (min cosine {result['min_cosine']:.4f} < {threshold})")
+        print("✅ ONNX embeddings match the PyTorch model")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+"""Request profiling: on demand for authorized users, and sampled in the background.
+
+On demand: a user listed in PROFILE_ALLOWED_USERS sends `X-Profile: 1` (or `?profile=1`).
+The response gets an `X-Profile-Id` header, and the profile is saved to PROFILE_DIR and
+served by GET /profiles/{id}. It contains a call tree, top functions by self and total
+samples, folded stacks for flame graphs, and the tracemalloc allocation peak. Tracing
+allocations slows allocation-heavy code down a lot, so `X-Profile: cpu` skips it for
+timings that are closer to the real ones.
+
+Sampled: with PROFILE_SAMPLE_RATE > 0, that fraction of requests is profiled too (no
+tracemalloc), as long as the sampler stays within PROFILE_OVERHEAD_BUDGET of one core:
+once the budget runs out, sampled profiles stop collecting and on-demand ones are sampled
+less often until it refills. Only the PROFILE_KEEP_SLOWEST slowest sampled profiles are
+kept in PROFILE_DIR, counting those written by other processes sharing it.
+
+Request work runs on the event loop and on threadpool workers, so profiling is by stack
+sampling: every PROFILE_SAMPLE_INTERVAL_MS one thread snapshots the stacks of all busy
+threads. Threads that are only waiting (idle pool workers, the event loop in select) are
+skipped. The samples cover the whole process, not just the profiled request, so other
+requests in flight at the same time show up too; `concurrent_requests` in the report says
+how many there were.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import Depends, HTTPException
+from auth_clerk import get_current_user_id, verify_clerk_token
+from backend.services.metrics import IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ALLOWED_USERS = {u.strip() for u in os.getenv("PROFILE_ALLOWED_USERS", "").split(",") if u.strip()}
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # 0 = only on demand
+PROFILE_OVERHEAD_BUDGET = float(os.getenv("PROFILE_OVERHEAD_BUDGET", "0.01"))  # share of one core
+PROFILE_KEEP_SLOWEST = int(os.getenv("PROFILE_KEEP_SLOWEST", "20"))
+# A profile whose response never completes (e.g. the client vanished) is closed after this long
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+# Paths never picked for sampled profiling
+PROFILE_SKIP_PATHS = ("/health", "/ready", "/metrics", "/profiles")
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_IDLE_FILES = {"threading.py", "selectors.py", "queue.py", "thread.py", "base_events.py"}
+_PROFILE_ID = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$")
+
+class Profile:
+    def __init__(self, mode, method, path):
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.mode = mode  # on_demand | sampled
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.status_code = None
+        self.stacks = {}  # (thread name, frame labels outermost first) -> samples
+        self.samples = 0
+        self.concurrent_requests = 0
+        self.tracemalloc_baseline = None
+        self.tracemalloc_peak = None
+        # Other full profiles traced at the same time: tracemalloc has one process-wide
+        # peak, so theirs and this one's can't be told apart
+        self.tracemalloc_overlap = 0
+        self.over_budget = False  # the sampler ran out of overhead budget during this profile
+        self._finished = False
+
+    def add(self, stacks, in_flight):
+        self.samples += 1
+        self.concurrent_requests = max(self.concurrent_requests, in_flight)
+        for stack in stacks:
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def report(self):
+        """The profile as a JSON-serialisable dict"""
+        total = max(1, sum(self.stacks.values()))
+        self_counts, total_counts = {}, {}
+        tree = {"name": "all", "samples": 0, "children": {}}
+        for (thread_name, frames), count in self.stacks.items():
+            self_counts[frames[-1]] = self_counts.get(frames[-1], 0) + count
+            for label in set(frames):
+                total_counts[label] = total_counts.get(label, 0) + count
+            node = tree
+            node["samples"] += count
+            for label in (thread_name,) + frames:
+                node = node["children"].setdefault(label, {"name": label, "samples": 0, "children": {}})
+                node["samples"] += count
+
+        def prune(node):
+            children = [child for child in node["children"].values() if child["samples"] / total >= 0.005]
+            children.sort(key=lambda child: -child["samples"])
+            return {"name": node["name"], "samples": node["samples"], "children": [prune(child) for child in children]}
+
+        top = sorted(total_counts, key=lambda label: (-self_counts.get(label, 0), -total_counts[label]))[:30]
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status_code,
+            "started_at": self.started_at,
+            "duration_ms": (self.duration or 0) * 1000,
+            "sample_interval_ms": PROFILE_SAMPLE_INTERVAL_MS,
+            "samples": self.samples,
+            "concurrent_requests": self.concurrent_requests,
+            "over_budget": self.over_budget,
+            "tracemalloc_peak_bytes": self.tracemalloc_peak,
+            "tracemalloc_overlapping_profiles": self.tracemalloc_overlap,
+            "top_functions": [{
+                "function": label,
+                "self": self_counts.get(label, 0),
+                "self_pct": 100 * self_counts.get(label, 0) / total,
+                "total": total_counts[label],
+                "total_pct": 100 * total_counts[label] / total,
+            } for label in top],
+            "call_tree": prune(tree),
+            "collapsed": [f"{';'.join((thread_name,) + frames)} {count}"
+                          for (thread_name, frames), count in sorted(self.stacks.items(), key=lambda item: -item[1])],
+        }
+
+class OverheadBudget:
+    """Token bucket of sampler CPU seconds, refilled at budget seconds per wall-clock second"""
+
+    def __init__(self, budget, burst=1.0):
+        self.budget = budget
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.budget)
+        self.updated = now
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return self.tokens > 0
+
+    def charge(self, seconds):
+        with self._lock:
+            self._refill()
+            self.tokens -= seconds
+
+    def wait_time(self):
+        """Seconds until the budget is available again; 0 if it is now"""
+        with self._lock:
+            self._refill()
+            if self.tokens > 0:
+                return 0.0
+            return -self.tokens / self.budget if self.budget > 0 else float("inf")
+
+class Sampler:
+    """One background thread sampling all threads' stacks while any profile is active"""
+
+    def __init__(self, interval, budget):
+        self.interval = interval
+        self.budget = budget
+        self._profiles = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._labels = {}  # code object -> "function (file:line)"
+
+    def add(self, profile):
+        with self._lock:
+            self._profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+
+    def remove(self, profile):
+        with self._lock:
+            self._profiles.discard(profile)
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            if filename.startswith(_PROJECT_ROOT):
+                filename = os.path.relpath(filename, _PROJECT_ROOT)
+            else:
+                filename = "/".join(filename.split(os.sep)[-2:])
+            label = self._labels[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+        return label
+
+    def _stacks(self):
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            innermost = os.path.basename(frame.f_code.co_filename)
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            # Waiting with none of our code on the stack: an idle worker or the event loop in select
+            if innermost in _IDLE_FILES and not any(c.co_filename.startswith(_PROJECT_ROOT)
+                                                    and "site-packages" not in c.co_filename for c in codes):
+                continue
+            # Pool threads are numbered; group them by pool
+            name = re.sub(r"([_ -]?\d+)+$", "", names.get(ident, "thread"))
+            stacks.append((name, tuple(self._label(code) for code in reversed(codes))))
+        return stacks
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._profiles:
+                    self._thread = None
+                    return
+                profiles = list(self._profiles)
+            start = time.perf_counter()
+            for profile in profiles:
+                if start - profile.start > PROFILE_MAX_SECONDS:
+                    finish(profile, None)
+            stacks = self._stacks()
+            in_flight = int(IN_FLIGHT.value(component="http"))
+            # Under the lock, so a profile never changes once remove() has returned
+            with self._lock:
+                for profile in self._profiles:
+                    profile.add(stacks, in_flight)
+            spent = time.perf_counter() - start
+            self.budget.charge(spent)
+            wait = self.budget.wait_time()
+            if wait:
+                # Out of budget: sampled profiles end here (their requests still finish and
+                # save what was collected); on-demand ones go on at the rate the budget allows
+                with self._lock:
+                    for profile in list(self._profiles):
+                        profile.over_budget = True
+                        if profile.mode == "sampled":
+                            self._profiles.discard(profile)
+            time.sleep(min(1.0, max(self.interval - spent, wait)))
+
+sampler = Sampler(PROFILE_SAMPLE_INTERVAL_MS / 1000, OverheadBudget(PROFILE_OVERHEAD_BUDGET))
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_profiles = set()  # full profiles being traced
+_tracemalloc_owned = False
+
+def _start_tracemalloc(profile):
+    global _tracemalloc_owned
+    with _tracemalloc_lock:
+        if not _tracemalloc_profiles:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _tracemalloc_owned = True
+            # Only the first profile resets the peak; later ones would wipe the earlier ones'
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+        _tracemalloc_profiles.add(profile)
+        for other in _tracemalloc_profiles:
+            other.tracemalloc_overlap = max(other.tracemalloc_overlap, len(_tracemalloc_profiles) - 1)
+        profile.tracemalloc_baseline = tracemalloc.get_traced_memory()[0]
+
+def _stop_tracemalloc(profile):
+    global _tracemalloc_owned
+    with _tracemalloc_lock:
+        peak = tracemalloc.get_traced_memory()[1] - profile.tracemalloc_baseline
+        _tracemalloc_profiles.discard(profile)
+        if not _tracemalloc_profiles and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+        return max(0, peak)
+
+def _requested_mode(request):
+    """None, "cpu" (stack samples only) or "full" (plus tracemalloc)"""
+    flag = (request.headers.get("x-profile") or request.query_params.get("profile") or "").lower()
+    if flag == "cpu":
+        return "cpu"
+    return "full" if flag in ("1", "true", "yes") else None
+
+async def _is_allowed(request):
+    auth_header = request.headers.get("authorization", "")
+    if not PROFILE_ALLOWED_USERS or not auth_header.startswith("Bearer "):
+        return False
+    try:
+        user = await verify_clerk_token(auth_header.split(" ", 1)[1])
+    except Exception:
+        return False
+    # The endpoint's auth dependency reuses this instead of verifying the token again
+    request.state.clerk_user = user
+    return user.get("sub") in PROFILE_ALLOWED_USERS
+
+async def begin(request):
+    """Start profiling this request if it asked for it (and may) or is sampled; else None"""
+    requested = _requested_mode(request)
+    if requested and await _is_allowed(request):
+        profile = Profile("on_demand", request.method, request.url.path)
+        if requested == "full":
+            _start_tracemalloc(profile)
+    elif (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+          and not request.url.path.startswith(PROFILE_SKIP_PATHS) and sampler.budget.available()):
+        profile = Profile("sampled", request.method, request.url.path)
+    else:
+        return None
+    sampler.add(profile)
+    return profile
+
+# Building and writing a report takes a while for a big profile, so it happens here
+# rather than on the event loop; one thread also keeps the keep-slowest pruning serial
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profile-writer")
+_finish_lock = threading.Lock()
+
+def finish(profile, status_code):
+    """Stop profiling; the report is written in the background. Safe to call from any thread."""
+    # The sampler thread (PROFILE_MAX_SECONDS) and the response can both get here
+    with _finish_lock:
+        if profile._finished:
+            return
+        profile._finished = True
+    profile.duration = time.perf_counter() - profile.start
+    profile.status_code = status_code
+    sampler.remove(profile)
+    if profile.tracemalloc_baseline is not None:
+        profile.tracemalloc_peak = _stop_tracemalloc(profile)
+    _writer.submit(_store, profile)
+
+def _store(profile):
+    if profile.mode == "on_demand":
+        if _save(profile):
+            logger.info(f"Profiled {profile.method} {profile.path} in {profile.duration * 1000:.0f} ms: {profile.id}")
+        return
+    # Keep the slowest sampled profiles in PROFILE_DIR, whichever process wrote them
+    duration_ms = profile.duration * 1000
+    kept = sorted((summary["duration_ms"] or 0, summary["id"]) for summary in _summaries()
+                  if summary["mode"] == "sampled")
+    if len(kept) < PROFILE_KEEP_SLOWEST or (kept and duration_ms > kept[0][0]):
+        if _save(profile):
+            kept.append((duration_ms, profile.id))
+            kept.sort()
+    for _, profile_id in kept[:max(0, len(kept) - PROFILE_KEEP_SLOWEST)]:
+        _delete(profile_id)
+
+def wrap_response(profile, response):
+    """Finish the profile once the response body has been sent (streaming bodies included)"""
+    body = response.body_iterator
+
+    async def profiled_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            # Cheap; the report is built and saved on the writer thread
+            finish(profile, response.status_code)
+
+    response.body_iterator = profiled_body()
+    if profile.mode == "on_demand":
+        response.headers["X-Profile-Id"] = profile.id
+    return response
+
+def _path(profile_id):
+    return os.path.join(PROFILE_DIR, f"{profile_id}.json")
+
+def _save(profile):
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        # Write then rename, so other processes scanning PROFILE_DIR never read half a file
+        temp_path = _path(profile.id) + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(profile.report(), f)
+        os.replace(temp_path, _path(profile.id))
+        return True
+    except Exception as e:
+        logger.warning(f"Could not save profile {profile.id}: {e}")
+        return False
+
+def _delete(profile_id):
+    try:
+        os.remove(_path(profile_id))
+    except OSError:
+        pass
+
+def load(profile_id):
+    if not _PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(_path(profile_id), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+_SUMMARY_KEYS = ("id", "mode", "method", "path", "status", "started_at", "duration_ms", "samples")
+_summary_cache = {}  # file name -> (mtime, summary); profiles are written once, so rarely stale
+_summary_lock = threading.Lock()
+
+def _summaries():
+    """Summaries of every profile in PROFILE_DIR; only files not seen before are parsed"""
+    try:
+        entries = [entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".json")]
+    except OSError:
+        return []
+    summaries = []
+    with _summary_lock:
+        seen = set()
+        for entry in entries:
+            seen.add(entry.name)
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            cached = _summary_cache.get(entry.name)
+            if cached is None or cached[0] != mtime:
+                report = load(entry.name[:-len(".json")])
+                if report is None:
+                    continue
+                cached = _summary_cache[entry.name] = (mtime, {key: report.get(key) for key in _SUMMARY_KEYS})
+            summaries.append(cached[1])
+        for name in set(_summary_cache) - seen:
+            del _summary_cache[name]
+    return summaries
+
+def list_profiles():
+    """Summaries of the stored profiles, slowest first"""
+    return sorted(_summaries(), key=lambda summary: -(summary["duration_ms"] or 0))
+
+async def require_profiler(user_id: str = Depends(get_current_user_id)):
+    if user_id not in PROFILE_ALLOWED_USERS:
+        raise HTTPException(status_code=403, detail="Not allowed to read profiles")
+    return user_id
@@ -0,0 +1,51 @@
+# singleflight.py
+
+import asyncio
+from backend.services.metrics import stage, SINGLEFLIGHT_CALLS
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one in-flight computation.
+
+    The first caller (leader) starts the work; callers arriving while it runs (followers)
+    await the same result. Only in-flight work is shared - nothing is cached after it
+    finishes. The work keeps running while anyone is still waiting, and is cancelled
+    once every caller has gone away.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}  # key -> [task, waiter count]
+
+    def in_flight(self):
+        return len(self._calls)
+
+    async def do(self, key, fn, *args, **kwargs):
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            call = self._calls[key] = [task, 0]
+            task.add_done_callback(lambda _: self._forget(key, task))
+            SINGLEFLIGHT_CALLS.inc(flight=self.name, role="leader")
+            return await self._wait(key, call)
+
+        SINGLEFLIGHT_CALLS.inc(flight=self.name, role="follower")
+        with stage(f"{self.name}_coalesced"):
+            return await self._wait(key, call)
+
+    async def _wait(self, key, call):
+        task = call[0]
+        call[1] += 1
+        try:
+            # Shield so one caller disconnecting doesn't cancel the work for the others
+            return await asyncio.shield(task)
+        finally:
+            call[1] -= 1
+            if call[1] == 0 and not task.done():
+                # Nobody left to answer; new arrivals must start fresh rather than join a dying task
+                self._forget(key, task)
+                task.cancel()
+
+    def _forget(self, key, task):
+        call = self._calls.get(key)
+        if call is not None and call[0] is task:
+            del self._calls[key]
@@ -0,0 +1,63 @@
+# startup.py
+
+import asyncio
+import time
+from starlette.concurrency import run_in_threadpool
+
+class StartupTracker:
+    """Tracks per-component warm-up status and timing for the /ready probe"""
+
+    def __init__(self):
+        self.created_at = time.perf_counter()
+        self.timings = {}      # phase/component -> seconds
+        self.components = {}   # component -> "pending" | "ready" | "failed"
+        self.errors = {}
+        self.ready_after = None
+
+    def record(self, name, seconds):
+        self.timings[name] = round(seconds, 4)
+
+    @property
+    def ready(self):
+        return bool(self.components) and all(state == "ready" for state in self.components.values())
+
+    async def _run_component(self, name, warm_up):
+        start = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(warm_up):
+                await warm_up()
+            else:
+                # Imports and model loads are blocking - keep them off the event loop
+                await run_in_threadpool(warm_up)
+            self.components[name] = "ready"
+        except Exception as e:
+            self.components[name] = "failed"
+            self.errors[name] = str(e)
+            print(f"❌ Warm-up of {name} failed: {e}")
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    async def warm_up(self, stages):
+        """Run warm-up stages in order; the components within one stage run concurrently.
+
+        stages is a list of {component_name: callable} dicts.
+        """
+        for stage in stages:
+            for name in stage:
+                self.components[name] = "pending"
+        for stage in stages:
+            await asyncio.gather(*(self._run_component(name, fn) for name, fn in stage.items()))
+        if self.ready:
+            self.ready_after = round(time.perf_counter() - self.created_at, 4)
+        print(f"🚦 Startup report: {self.report()}")
+
+    def report(self):
+        return {
+            "ready": self.ready,
+            "components": dict(self.components),
+            "timings_seconds": dict(self.timings),
+            "ready_after_seconds": self.ready_after,
+            "errors": dict(self.errors),
+        }
+
+startup = StartupTracker()
@@ -0,0 +1,114 @@
+"""HNSW index settings for the Chroma collections.
+
+Chroma builds an HNSW index per collection from its `hnsw:*` metadata, and only at
+creation time: the distance space, M (graph degree), construction ef and search ef
+are then fixed for the life of the collection. These can be set from the
+environment; anything left unset keeps Chroma's default.
+
+    HNSW_SPACE            l2 | cosine | ip   (Chroma default: l2)
+    HNSW_M                links per node     (16)
+    HNSW_CONSTRUCTION_EF  build beam width   (100)
+    HNSW_SEARCH_EF        query beam width   (10)
+
+Collections that already exist keep the settings they were built with. Rebuild them
+with the current settings (documents and embeddings are copied, nothing is re-embedded):
+
+    python -m backend.services.vector_index --reindex --chroma-path ./chroma_db
+
+Measure the recall/latency trade-off first with benchmarks/bench_hnsw.py.
+"""
+
+import argparse
+import os
+
+CHROMA_HNSW_DEFAULTS = {"hnsw:space": "l2", "hnsw:M": 16, "hnsw:construction_ef": 100, "hnsw:search_ef": 10}
+
+HNSW_SPACE = os.getenv("HNSW_SPACE", "")
+HNSW_M = os.getenv("HNSW_M", "")
+HNSW_CONSTRUCTION_EF = os.getenv("HNSW_CONSTRUCTION_EF", "")
+HNSW_SEARCH_EF = os.getenv("HNSW_SEARCH_EF", "")
+
+def hnsw_metadata(space=HNSW_SPACE, M=HNSW_M, construction_ef=HNSW_CONSTRUCTION_EF, search_ef=HNSW_SEARCH_EF):
+    """Collection metadata for the given index settings; empty values are left to Chroma"""
+    settings = {}
+    if space:
+        if space not in ("l2", "cosine", "ip"):
+            raise ValueError(f"Unknown HNSW space: {space} (expected l2, cosine or ip)")
+        settings["hnsw:space"] = space
+    for key, value in (("hnsw:M", M), ("hnsw:construction_ef", construction_ef), ("hnsw:search_ef", search_ef)):
+        if value not in ("", None):
+            settings[key] = int(value)
+    return settings
+
+def index_space(settings):
+    return settings.get("hnsw:space", CHROMA_HNSW_DEFAULTS["hnsw:space"])
+
+def open_collection(client, name, metadata=None, settings=None):
+    """get_or_create_collection that builds new collections with the given HNSW settings.
+
+    An existing collection is returned as it is; if it was built with different
+    settings that is reported, since Chroma can't change them in place.
+    """
+    settings = hnsw_metadata() if settings is None else settings
+    try:
+        collection = client.get_collection(name)
+    except ValueError:
+        return client.get_or_create_collection(name, metadata={**(metadata or {}), **settings} or None)
+    current = collection.metadata or {}
+    stale = [key for key, value in settings.items() if current.get(key, CHROMA_HNSW_DEFAULTS[key]) != value]
+    if stale:
+        built = ", ".join(f"{key}={current.get(key, CHROMA_HNSW_DEFAULTS[key])}" for key in stale)
+        print(f"⚠️ Collection {name} was built with {built}; run vector_index --reindex to apply the new settings")
+    return collection
+
+def distances(space, query_embedding, embeddings):
+    """Distances from one query to many vectors, as Chroma computes them in the given space"""
+    import numpy as np
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    if space == "cosine":
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+        return 1 - (vectors @ query) / np.clip(norms, 1e-12, None)
+    if space == "ip":
+        return 1 - vectors @ query
+    return ((vectors - query) ** 2).sum(axis=1)
+
+def _store_collections(client, collection_name):
+    """The chunk collection, its source shards and its document index"""
+    for collection in client.list_collections():
+        metadata = collection.metadata or {}
+        if collection.name in (collection_name, f"{collection_name}-doc-index") \
+                or metadata.get("shard_of") == collection_name:
+            yield collection
+
+def reindex(chroma_path, collection_name="documents", settings=None, page_size=1000):
+    """Rebuild the store's collections with the current HNSW settings (run with the app stopped)"""
+    import chromadb
+    settings = hnsw_metadata() if settings is None else settings
+    client = chromadb.PersistentClient(path=chroma_path)
+    for collection in list(_store_collections(client, collection_name)):
+        name = collection.name
+        metadata = {key: value for key, value in (collection.metadata or {}).items() if not key.startswith("hnsw:")}
+        rebuilt = client.create_collection(f"{name[:50]}-reindex", metadata={**metadata, **settings} or None)
+        total = collection.count()
+        for offset in range(0, total, page_size):
+            page = collection.get(offset=offset, limit=page_size, include=["documents", "embeddings", "metadatas"])
+            rebuilt.add(documents=page["documents"], embeddings=page["embeddings"],
+                        metadatas=page["metadatas"], ids=page["ids"])
+        client.delete_collection(name)
+        rebuilt.modify(name=name)
+        print(f"✅ Rebuilt {name} ({total} vectors) with {settings or 'Chroma defaults'}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the vector store's HNSW index settings")
+    parser.add_argument("--chroma-path", default="./chroma_db")
+    parser.add_argument("--collection", default="documents")
+    parser.add_argument("--reindex", action="store_true", help="rebuild every collection with the HNSW_* settings")
+    args = parser.parse_args(argv)
+    if args.reindex:
+        reindex(args.chroma_path, args.collection)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""Source-sharded vector store: one Chroma collection (and HNSW index) per source.
+
+A `where={"source_name": ...}` filter on one big collection makes HNSW search walk
+past every other source's vectors, which gets slow when the source is a small part
+of the corpus. With VECTOR_SHARDING=source, DocumentProcessor stores each source in
+its own collection instead: filtered queries search only their shard, and
+unfiltered queries fan out to all shards in parallel and k-way merge the top-k by
+distance. At most VECTOR_MAX_LOADED_SHARDS indexes stay in memory; idle shards
+beyond that are unloaded (least recently used first) and reloaded from disk on
+their next query.
+
+Copy an existing single-collection store into shards with:
+
+    python -m backend.services.vector_shards --migrate --chroma-path ./chroma_db
+"""
+
+import argparse
+import hashlib
+import heapq
+import itertools
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from backend.services.vector_index import hnsw_metadata
+
+VECTOR_SHARDING = os.getenv("VECTOR_SHARDING", "none")  # none | source
+VECTOR_MAX_LOADED_SHARDS = int(os.getenv("VECTOR_MAX_LOADED_SHARDS", "0"))  # 0 = keep every shard loaded
+VECTOR_SHARD_FANOUT_WORKERS = int(os.getenv("VECTOR_SHARD_FANOUT_WORKERS", "8"))
+# Chroma releases whose private segment manager _unload_collection knows (requirements pins 0.4.22)
+UNLOAD_CHROMA_VERSIONS = ("0.4.",)
+
+def shard_collection_name(base_name, source_name):
+    """A valid Chroma collection name (3-63 chars of [a-zA-Z0-9_-], alphanumeric ends) per source"""
+    slug = re.sub(r"[^a-zA-Z0-9_-]+", "-", source_name).strip("-_")[:32]
+    digest = hashlib.sha1(source_name.encode("utf-8")).hexdigest()[:10]
+    prefix = re.sub(r"[^a-zA-Z0-9_-]+", "-", base_name)[:16].strip("-_") or "shard"
+    return f"{prefix}-{slug}-{digest}" if slug else f"{prefix}-{digest}"
+
+def _pinned_source(where):
+    if not where or set(where) != {"source_name"}:
+        return None
+    condition = where["source_name"]
+    if isinstance(condition, str):
+        return condition
+    if isinstance(condition, dict) and set(condition) == {"$eq"}:
+        return condition["$eq"]
+    return None
+
+def split_source(where):
+    """(source the where clause pins the query to, the rest of the clause); source is None
+    when the query may span several sources"""
+    source_name = _pinned_source(where)
+    if source_name is not None:
+        return source_name, None
+    if where and set(where) == {"$and"}:
+        for i, condition in enumerate(where["$and"]):
+            source_name = _pinned_source(condition)
+            if source_name is not None:
+                rest = where["$and"][:i] + where["$and"][i + 1:]
+                return source_name, (rest[0] if len(rest) == 1 else {"$and": rest}) if rest else None
+    return None, where
+
+class ShardedCollection:
+    """Drop-in for the parts of a Chroma collection DocumentProcessor uses, sharded by source_name"""
+
+    def __init__(self, client, base_name, max_loaded=VECTOR_MAX_LOADED_SHARDS,
+                 fanout_workers=VECTOR_SHARD_FANOUT_WORKERS, settings=None):
+        self.client = client
+        self.base_name = base_name
+        # HNSW settings for new shards; every shard should share one distance space for the merge
+        self.settings = hnsw_metadata() if settings is None else settings
+        if max_loaded and not _can_unload(client):
+            print("⚠️ VECTOR_MAX_LOADED_SHARDS needs a local Chroma "
+                  f"{' or '.join(v + 'x' for v in UNLOAD_CHROMA_VERSIONS)} client; keeping every shard loaded")
+            max_loaded = 0
+        self.max_loaded = max_loaded
+        self._lock = threading.Lock()
+        self._unloaded = threading.Condition(self._lock)
+        self._shards = {}           # source_name -> collection
+        self._loaded = OrderedDict()  # collection id -> collection, least recently used first
+        self._in_use = {}           # collection id -> operations in progress
+        self._unloading = set()     # collection ids being unloaded (outside the lock)
+        self._counts = {}           # collection id -> cached row count
+        self._writes = {}           # collection id -> writes so far, so a stale count isn't cached
+        self._executor = ThreadPoolExecutor(max_workers=fanout_workers, thread_name_prefix="shard")
+        for collection in client.list_collections():
+            metadata = collection.metadata or {}
+            if metadata.get("shard_of") == base_name:
+                self._shards[metadata["source_name"]] = collection
+
+    def sources(self):
+        with self._lock:
+            return list(self._shards)
+
+    def _all_shards(self):
+        with self._lock:
+            return list(self._shards.values())
+
+    def _shard(self, source_name, create=False):
+        with self._lock:
+            shard = self._shards.get(source_name)
+            if shard is None and create:
+                shard = self.client.get_or_create_collection(
+                    shard_collection_name(self.base_name, source_name),
+                    metadata={"shard_of": self.base_name, "source_name": source_name, **self.settings}
+                )
+                self._shards[source_name] = shard
+            return shard
+
+    @contextmanager
+    def _using(self, shard):
+        """Mark a shard busy (so it's never unloaded mid-query) and most recently used"""
+        with self._lock:
+            # A shard that's being unloaded can't be touched until its index is closed
+            while shard.id in self._unloading:
+                self._unloaded.wait()
+            self._in_use[shard.id] = self._in_use.get(shard.id, 0) + 1
+            self._loaded[shard.id] = shard
+            self._loaded.move_to_end(shard.id)
+        try:
+            yield shard
+        finally:
+            with self._lock:
+                self._in_use[shard.id] -= 1
+                if not self._in_use[shard.id]:
+                    del self._in_use[shard.id]
+                victims = self._evict()
+            # Unloading persists the whole index, so other shards mustn't wait behind it
+            if victims:
+                for collection_id in victims:
+                    _unload_collection(self.client, collection_id)
+                with self._lock:
+                    self._unloading.difference_update(victims)
+                    self._unloaded.notify_all()
+
+    def _evict(self):
+        """Pick least recently used idle shards to unload (call with the lock held)"""
+        victims = []
+        if not self.max_loaded:
+            return victims
+        for collection_id in list(self._loaded):
+            if len(self._loaded) <= self.max_loaded:
+                break
+            if collection_id not in self._in_use:
+                del self._loaded[collection_id]
+                self._unloading.add(collection_id)
+                victims.append(collection_id)
+        return victims
+
+    def _count(self, shard):
+        """A shard's row count, cached until the next write to it"""
+        with self._lock:
+            count = self._counts.get(shard.id)
+            writes = self._writes.get(shard.id, 0)
+        if count is None:
+            with self._using(shard):
+                count = shard.count()
+            with self._lock:
+                if self._writes.get(shard.id, 0) == writes:
+                    self._counts[shard.id] = count
+        return count
+
+    def _written(self, shard):
+        with self._lock:
+            self._writes[shard.id] = self._writes.get(shard.id, 0) + 1
+            self._counts.pop(shard.id, None)
+
+    def count(self):
+        return sum(self._count(shard) for shard in self._all_shards())
+
+    def add(self, documents, embeddings, metadatas, ids):
+        groups = {}
+        for row in zip(documents, embeddings, metadatas, ids):
+            groups.setdefault(row[2].get("source_name", "Unknown"), []).append(row)
+        for source_name, rows in groups.items():
+            docs, vectors, metas, row_ids = (list(column) for column in zip(*rows))
+            with self._using(self._shard(source_name, create=True)) as shard:
+                try:
+                    shard.add(documents=docs, embeddings=vectors, metadatas=metas, ids=row_ids)
+                finally:
+                    self._written(shard)
+
+    def _query_shard(self, shard, query_embeddings, n_results, where, include):
+        # Never ask a shard for more rows than it has (Chroma warns on every such query)
+        n_results = min(n_results, self._count(shard))
+        if not n_results:
+            return {field: [[] for _ in query_embeddings] for field in ["ids"] + include}
+        with self._using(shard):
+            return shard.query(query_embeddings=query_embeddings, n_results=n_results, where=where, include=include)
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("metadatas", "documents", "distances")):
+        include = list(include)
+        fields = ["ids"] + include
+        source_name, where = split_source(where)
+        if source_name is not None:
+            shard = self._shard(source_name)
+            if shard is None:
+                return {field: [[] for _ in query_embeddings] for field in fields}
+            return self._query_shard(shard, query_embeddings, n_results, where, include)
+
+        shards = self._all_shards()
+        # Phase 1: only ids and distances from every shard (fetching documents and metadata
+        # is most of a small query's cost); each shard's hits come back sorted by distance
+        results = list(self._executor.map(
+            lambda shard: self._query_shard(shard, query_embeddings, n_results, where, ["distances"]), shards
+        ))
+        top_per_query = []
+        for q in range(len(query_embeddings)):
+            per_shard = [
+                [(distance, s, i) for i, distance in enumerate(result["distances"][q])]
+                for s, result in enumerate(results)
+            ]
+            top_per_query.append(list(itertools.islice(heapq.merge(*per_shard), n_results)))
+
+        # Phase 2: fetch the requested fields for the global top-k only, one get() per shard
+        rows = {}
+        payload_fields = [field for field in include if field != "distances"]
+        if payload_fields:
+            wanted = {}
+            for q, top in enumerate(top_per_query):
+                for _, s, i in top:
+                    wanted.setdefault(s, set()).add(results[s]["ids"][q][i])
+            for s, ids in wanted.items():
+                with self._using(shards[s]):
+                    fetched = shards[s].get(ids=list(ids), include=payload_fields)
+                for n, row_id in enumerate(fetched["ids"]):
+                    rows[(s, row_id)] = {field: fetched[field][n] for field in payload_fields}
+
+        merged = {field: [] for field in fields}
+        for q, top in enumerate(top_per_query):
+            hits = [(distance, s, results[s]["ids"][q][i]) for distance, s, i in top]
+            merged["ids"].append([row_id for _, _, row_id in hits])
+            if "distances" in include:
+                merged["distances"].append([distance for distance, _, _ in hits])
+            for field in payload_fields:
+                merged[field].append([rows[(s, row_id)][field] for _, s, row_id in hits])
+        return merged
+
+    def get(self, ids=None, where=None, include=("metadatas", "documents")):
+        include = list(include)
+        source_name, where = split_source(where)
+        if source_name is not None:
+            shard = self._shard(source_name)
+            shards = [shard] if shard is not None else []
+        else:
+            shards = self._all_shards()
+        combined = {"ids": []}
+        for field in include:
+            combined[field] = []
+        for shard in shards:
+            with self._using(shard):
+                result = shard.get(ids=ids, where=where, include=include)
+            for field in combined:
+                combined[field].extend(result.get(field) or [])
+        return combined
+
+    def delete(self, ids, where=None):
+        """Delete ids from the shards that hold them; a where clause pinning a source
+        goes straight to that shard"""
+        source_name, _ = split_source(where)
+        if source_name is not None:
+            shard = self._shard(source_name)
+            shards = [shard] if shard is not None else []
+        else:
+            shards = self._all_shards()
+        remaining = set(ids)
+        for shard in shards:
+            if not remaining:
+                break
+            if not self._count(shard):
+                continue
+            with self._using(shard):
+                # Looking ids up is cheap; deleting ids a shard doesn't have isn't
+                found = shard.get(ids=list(remaining), where=where, include=[])["ids"]
+                if not found:
+                    continue
+                try:
+                    shard.delete(ids=found)
+                finally:
+                    self._written(shard)
+            remaining.difference_update(found)
+
+    def drop_source(self, source_name):
+        """Delete a whole source by dropping its shard; returns the number of chunks removed"""
+        with self._lock:
+            shard = self._shards.pop(source_name, None)
+            if shard is None:
+                return 0
+            self._loaded.pop(shard.id, None)
+            self._counts.pop(shard.id, None)
+        count = shard.count()
+        self.client.delete_collection(shard.name)
+        return count
+
+    def drop_all(self):
+        return sum(self.drop_source(source_name) for source_name in self.sources())
+
+def _can_unload(client):
+    """Whether _unload_collection can work with this Chroma version and client"""
+    import chromadb
+    if not chromadb.__version__.startswith(UNLOAD_CHROMA_VERSIONS):
+        return False
+    manager = getattr(getattr(client, "_server", None), "_manager", None)
+    return all(hasattr(manager, name) for name in ("_lock", "_segment_cache", "_instances"))
+
+def _unload_collection(client, collection_id):
+    """Release a collection's in-memory HNSW index; Chroma reloads it from disk on next use.
+
+    Chroma 0.4.x keeps every index it has touched loaded for the life of the process and
+    has no public way to let one go, so this reaches into its local segment manager.
+    ShardedCollection checks _can_unload first; with other Chroma versions or a
+    client/server setup shards just stay loaded.
+    """
+    manager = getattr(getattr(client, "_server", None), "_manager", None)
+    segment_cache = getattr(manager, "_segment_cache", None)
+    instances = getattr(manager, "_instances", None)
+    if segment_cache is None or instances is None:
+        return False
+    try:
+        with manager._lock:
+            for segment in segment_cache.pop(collection_id, {}).values():
+                instance = instances.pop(segment["id"], None)
+                if instance is None:
+                    continue
+                if getattr(instance, "_index", None) is not None and hasattr(instance, "_persist"):
+                    # Rows still in the brute-force write buffer aren't in the HNSW index yet,
+                    # and a reload replays the log only after max_seq_id, so flush them first
+                    if len(instance._curr_batch):
+                        instance._apply_batch(instance._curr_batch)
+                        instance._curr_batch = type(instance._curr_batch)()
+                        instance._brute_force_index.clear()
+                    instance._persist()
+                if hasattr(instance, "close_persistent_index"):
+                    instance.close_persistent_index()
+                instance.stop()
+            handle_cache = getattr(manager, "_vector_instances_file_handle_cache", None)
+            if handle_cache is not None:
+                handle_cache.cache.pop(collection_id, None)
+        return True
+    except Exception as e:
+        print(f"⚠️ Could not unload shard {collection_id}: {e}")
+        return False
+
+def migrate(chroma_path, collection_name="documents", page_size=1000):
+    """Copy a single-collection store into per-source shards (the original is left untouched)"""
+    import chromadb
+    client = chromadb.PersistentClient(path=chroma_path)
+    source = client.get_collection(collection_name)
+    sharded = ShardedCollection(client, collection_name)
+    total = source.count()
+    for offset in range(0, total, page_size):
+        page = source.get(offset=offset, limit=page_size, include=["documents", "embeddings", "metadatas"])
+        sharded.add(documents=page["documents"], embeddings=page["embeddings"],
+                    metadatas=page["metadatas"], ids=page["ids"])
+        print(f"⏳ Copied {min(offset + page_size, total)}/{total} chunks...")
+    print(f"✅ Sharded {total} chunks into {len(sharded.sources())} source collections")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the source-sharded vector store")
+    parser.add_argument("--chroma-path", default="./chroma_db")
+    parser.add_argument("--collection", default="documents")
+    parser.add_argument("--migrate", action="store_true", help="copy the single collection into per-source shards")
+    args = parser.parse_args(argv)
+    if args.migrate:
+        migrate(args.chroma_path, args.collection)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
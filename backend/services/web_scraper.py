@@ -4,6 +4,7 @@ from datetime import datetime
 import httpx
 from bs4 import BeautifulSoup
 from typing import Optional, Tuple
+from backend.services.metrics import stage, IN_FLIGHT
 
 class WebScraper:
     def __init__(self, output_dir="scraped_content"):
@@ -16,27 +17,19 @@ class WebScraper:
     async def scrape_website(self, url: str) -> Optional[str]:
         try:
             print(f"🔄 Starting scrape of: {url}")
-            async with httpx.AsyncClient(headers=self.headers, timeout=60.0) as client:  # Reduced timeout
-                print(f"📡 Fetching content from: {url}")
-                response = await client.get(url)
-                response.raise_for_status()
-                
-                print(f"✅ Content fetched, processing HTML...")
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # Remove unwanted elements
-                for element in soup(["script", "style", "nav", "footer", "header"]):
-                    element.decompose()
-                
-                # Extract text content
-                text = soup.get_text(separator='\n', strip=True)
-                
-                # Basic text cleaning
-                lines = [line.strip() for line in text.splitlines() if line.strip()]
-                cleaned_text = '\n\n'.join(lines)
-                
-                print(f"📝 Extracted {len(cleaned_text)} characters of text")
-                return cleaned_text
+            with IN_FLIGHT.track_inprogress(component="scrape"):
+                async with httpx.AsyncClient(headers=self.headers, timeout=60.0) as client:  # Reduced timeout
+                    print(f"📡 Fetching content from: {url}")
+                    with stage("scrape_fetch"):
+                        response = await client.get(url)
+                        response.raise_for_status()
+                    
+                    print(f"✅ Content fetched, processing HTML...")
+                    with stage("scrape_parse"):
+                        cleaned_text = self.parse_html(response.content)
+                    
+                    print(f"📝 Extracted {len(cleaned_text)} characters of text")
+                    return cleaned_text
         except httpx.RequestError as e:
             print(f"❌ Request error for {url}: {str(e)}")
             return None
@@ -44,6 +37,20 @@ class WebScraper:
             print(f"❌ Error scraping {url}: {str(e)}")
             return None
 
+    def parse_html(self, html) -> str:
+        soup = BeautifulSoup(html, 'html.parser')
+        
+        # Remove unwanted elements
+        for element in soup(["script", "style", "nav", "footer", "header"]):
+            element.decompose()
+        
+        # Extract text content
+        text = soup.get_text(separator='\n', strip=True)
+        
+        # Basic text cleaning
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        return '\n\n'.join(lines)
+
     def save_to_markdown(self, content: str, url: str) -> Optional[str]:
         if not content:
             return None
@@ -0,0 +1,107 @@
+"""Compare embedding backends: PyTorch sentence-transformers vs ONNX Runtime (fp32 / int8).
+
+Reports cold-start time, single-query latency, ingestion-batch throughput and cosine
+parity against the PyTorch embeddings. Needs the model locally (run the ONNX export
+once first: python -m backend.services.onnx_embedder --export --quantize).
+
+    python -m benchmarks.bench_embeddings --output embeddings.json
+"""
+
+import os
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import argparse
+import json
+import sys
+import time
+
+from benchmarks.bench_hot_paths import summarize
+from benchmarks.fixtures import make_chunks
+
+def load_backend(name, model_name, threads):
+    start = time.perf_counter()
+    if name == "torch":
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(model_name, device="cpu")
+    else:
+        from backend.services.onnx_embedder import OnnxEmbedder
+        model = OnnxEmbedder(model_name, quantized=(name == "onnx-int8"), intra_op_threads=threads, export_if_missing=False)
+    return model, time.perf_counter() - start
+
+def bench_backend(model, queries, chunks, batch_size, repeat):
+    model.encode(queries[:4])  # warm up allocations and kernels
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        model.encode(query)
+        samples.append(time.perf_counter() - start)
+    single = summarize(samples)
+
+    batch_seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model.encode(chunks, batch_size=batch_size)
+        batch_seconds.append(time.perf_counter() - start)
+    best = min(batch_seconds)
+    return {"query_latency": single, "batch_seconds": best, "batch_texts_per_second": len(chunks) / best}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=None, help="model name (default: EMBEDDING_MODEL_NAME)")
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--threads", type=int, default=0, help="ONNX Runtime intra-op threads (0 = default)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=256, help="texts in the ingestion batch")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    from backend.services.embeddings import EMBEDDING_MODEL_NAME
+    from backend.services.onnx_embedder import check_parity
+    model_name = args.model or EMBEDDING_MODEL_NAME
+    queries = [text for text, _ in make_chunks(args.queries, seed=1, words=12)]
+    chunks = [text for text, _ in make_chunks(args.chunks, seed=2, words=200)]
+
+    results = {}
+    reference = None
+    for name in args.backends.split(","):
+        model, load_seconds = load_backend(name, model_name, args.threads)
+        print(f"⏳ {name}: loaded in {load_seconds:.2f}s, measuring...", flush=True)
+        result = bench_backend(model, queries, chunks, args.batch_size, args.repeat)
+        result["load_seconds"] = load_seconds
+        if name == "torch":
+            reference = model
+        elif reference is not None:
+            result["parity"] = check_parity(reference, model, queries[:50] + chunks[:50],
+                                            min_cosine=0.98 if name == "onnx-int8" else 0.999)
+        results[name] = result
+
+    if "torch" in results:
+        base = results["torch"]
+        for name, result in results.items():
+            result["query_p50_speedup"] = base["query_latency"]["p50"] / result["query_latency"]["p50"]
+            result["batch_speedup"] = result["batch_texts_per_second"] / base["batch_texts_per_second"]
+
+    print(f"\n{'backend':<10} {'load s':>7} {'query p50 ms':>13} {'p95 ms':>8} {'batch txt/s':>12} {'speedup':>8} {'min cos':>8}")
+    for name, r in results.items():
+        parity = r.get("parity", {}).get("min_cosine")
+        print(f"{name:<10} {r['load_seconds']:>7.2f} {r['query_latency']['p50']:>13.2f} {r['query_latency']['p95']:>8.2f} "
+              f"{r['batch_texts_per_second']:>12.1f} {r.get('batch_speedup', 1.0):>7.2f}x "
+              f"{parity if parity is not None else float('nan'):>8.4f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"model": model_name, "threads": args.threads, "results": results}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+
+    failed = [name for name, r in results.items() if r.get("parity") and not r["parity"]["ok"]]
+    if failed:
+        print(f"❌ Parity check failed for: {', '.join(failed)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""HNSW parameter sweep: recall@k, query latency and index size per index setting.
+
+Builds one Chroma index per combination of distance space, M, construction ef and
+search ef over a synthetic corpus (see fixtures.make_documents), then runs generated
+query/answer pairs against each: a query is a snippet of one chunk, its answer is that
+chunk. Every index is scored against exact brute-force search in the same space.
+
+    python -m benchmarks.bench_hnsw --documents 1000 --m 8,16,32 --search-ef 10,50,100
+
+Apply the chosen setting with HNSW_SPACE / HNSW_M / HNSW_CONSTRUCTION_EF / HNSW_SEARCH_EF
+(see backend/services/vector_index.py).
+"""
+
+import os
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import argparse
+import itertools
+import json
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_hot_paths import quiet, summarize
+from benchmarks.bench_retrieval import load_corpus, recall
+from benchmarks.fakes import load_embedding_model
+from benchmarks.fixtures import make_documents
+
+def make_pairs(documents, count, seed, words=12):
+    """(query, answer chunk) pairs: each query is a short snippet of its answer"""
+    rng = np.random.default_rng(seed)
+    pairs = []
+    for _ in range(count):
+        _, _, chunks = documents[rng.integers(len(documents))]
+        answer = chunks[rng.integers(len(chunks))]
+        tokens = answer.split()
+        start = rng.integers(max(1, len(tokens) - words))
+        pairs.append((" ".join(tokens[start:start + words]), answer))
+    return pairs
+
+def index_bytes(chroma_path):
+    """On-disk size of the HNSW segment files (everything but Chroma's sqlite metadata store)"""
+    total = 0
+    for root, _, files in os.walk(chroma_path):
+        if root == chroma_path:
+            continue
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+def exact_top_k(space, query_embeddings, embeddings, k):
+    from backend.services.vector_index import distances
+    return [np.argsort(distances(space, q, embeddings), kind="stable")[:k] for q in query_embeddings]
+
+def run_sweep(args, model):
+    from backend.services.document_processor import DocumentProcessor
+    from backend.services.vector_index import hnsw_metadata
+    from backend.services.vector_shards import _unload_collection
+
+    documents = make_documents(args.documents, args.chunks_per_document, seed=args.seed)
+    queries, answers = zip(*make_pairs(documents, args.queries, seed=args.seed + 1))
+    query_embeddings = np.asarray(model.encode(list(queries)), dtype=np.float32)
+    embeddings = None
+    rows = []
+
+    with tempfile.TemporaryDirectory(prefix="rag-bench-hnsw-") as workdir:
+        grid = itertools.product(args.spaces.split(","), args.m.split(","),
+                                 args.construction_ef.split(","), args.search_ef.split(","))
+        for n, (space, M, construction_ef, search_ef) in enumerate(grid):
+            settings = hnsw_metadata(space, M, construction_ef, search_ef)
+            chroma_path = os.path.join(workdir, f"index_{n}")
+            processor = DocumentProcessor(embedding_model=model, chroma_path=chroma_path,
+                                          sharding="none", retrieval_mode="flat", index_settings=settings)
+            start = time.perf_counter()
+            with quiet():
+                texts, embeddings = load_corpus(processor, model, documents, embeddings=embeddings)
+            build_seconds = time.perf_counter() - start
+            # Unloading flushes the whole index to disk, so its size can be measured
+            _unload_collection(processor.chroma_client, processor.collection.id)
+            size = index_bytes(chroma_path)
+
+            expected = [{texts[i] for i in top} for top in exact_top_k(space, query_embeddings, embeddings, args.k)]
+            processor.collection.query(query_embeddings=query_embeddings[:1].tolist(), n_results=args.k)  # reload
+            samples, found = [], []
+            for query_embedding in query_embeddings.tolist():
+                start = time.perf_counter()
+                result = processor.collection.query(query_embeddings=[query_embedding], n_results=args.k,
+                                                    include=["documents"])
+                samples.append(time.perf_counter() - start)
+                found.append(result["documents"][0])
+
+            rows.append({
+                "space": space, "M": int(M), "construction_ef": int(construction_ef), "search_ef": int(search_ef),
+                "latency": summarize(samples),
+                f"recall@{args.k}": recall(found, expected),
+                f"answer_hit@{args.k}": float(np.mean([a in f for f, a in zip(found, answers)])),
+                "build_seconds": build_seconds,
+                "index_mb": size / 2 ** 20,
+            })
+            print(f"{space:<7} {M:>4} {construction_ef:>7} {search_ef:>6} "
+                  f"{rows[-1]['latency']['p50']:>8.2f} {rows[-1]['latency']['p95']:>8.2f} "
+                  f"{rows[-1][f'recall@{args.k}']:>9.3f} {rows[-1][f'answer_hit@{args.k}']:>9.3f} "
+                  f"{build_seconds:>8.1f} {rows[-1]['index_mb']:>9.1f}")
+    return {"chunks": len(embeddings), "dimensions": int(embeddings.shape[1]), "rows": rows}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="local sentence-transformers model directory (default: hashing embedder)")
+    parser.add_argument("--documents", type=int, default=1000)
+    parser.add_argument("--chunks-per-document", type=int, default=10)
+    parser.add_argument("--spaces", default="l2", help="comma-separated distance spaces (l2, cosine, ip)")
+    parser.add_argument("--m", default="8,16,32", help="comma-separated M values")
+    parser.add_argument("--construction-ef", default="100,200", help="comma-separated construction ef values")
+    parser.add_argument("--search-ef", default="10,50,100", help="comma-separated search ef values")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    model = load_embedding_model(args.model)
+    print(f"{'space':<7} {'M':>4} {'build ef':>7} {'ef':>6} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'recall@' + str(args.k):>9} {'answer@' + str(args.k):>9} {'build s':>8} {'index MB':>9}")
+    results = run_sweep(args, model)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+"""Offline micro-benchmarks for the ingestion and retrieval hot paths.
+
+Runs with no network: fixtures are generated locally (or read from --fixtures),
+embeddings come from a deterministic hashing embedder (or a local
+sentence-transformers checkpoint via --model) and Gemini is replaced by a fake.
+
+    python -m benchmarks.bench_hot_paths                      # write results JSON
+    python -m benchmarks.bench_hot_paths --quick              # smaller, faster run
+    python -m benchmarks.bench_hot_paths --compare old.json   # diff against a previous run
+"""
+
+import os
+
+# Keep every library offline before anything imports them
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.fakes import FakeGeminiClient, load_embedding_model
+from benchmarks.fixtures import build_corpus, load_corpus, make_chunks, make_text
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = (len(sorted_values) - 1) * pct / 100
+    lower = int(index)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (index - lower)
+
+def summarize(samples_seconds):
+    """Latency statistics in milliseconds"""
+    values = sorted(s * 1000 for s in samples_seconds)
+    return {
+        "unit": "ms",
+        "n": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "min": values[0] if values else 0.0,
+        "max": values[-1] if values else 0.0,
+    }
+
+def throughput(value, unit):
+    return {"unit": unit, "value": value}
+
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the progress prints in the code under test"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+SHARDING = "none"
+
+def new_processor(model, workdir, name):
+    from backend.services.document_processor import DocumentProcessor
+    return DocumentProcessor(embedding_model=model, chroma_path=os.path.join(workdir, name), sharding=SHARDING)
+
+def bench_extract(results, processor, corpus, repeat):
+    for ext in (".pdf", ".docx", ".md", ".txt"):
+        paths = corpus.get(ext) or []
+        if not paths:
+            continue
+        results[f"extract_text{ext}"] = measure(lambda: [processor.extract_text(p) for p in paths], repeat)
+        chars = sum(len(processor.extract_text(p) or "") for p in paths)
+        mean_seconds = results[f"extract_text{ext}"]["mean"] / 1000
+        results[f"extract_text{ext}_throughput"] = throughput(chars / mean_seconds if mean_seconds else 0.0, "chars/s")
+
+def bench_chunk(results, processor, repeat, seed):
+    import random
+    for words in (10_000, 100_000):
+        rng = random.Random(seed)
+        paragraphs = max(1, words // 80)
+        text = make_text(rng, paragraphs=paragraphs, words=80)
+        results[f"chunk_text_{words}w"] = measure(lambda: processor.chunk_text(text), repeat)
+
+def bench_process_document(results, model, corpus, workdir, repeat):
+    paths = [p for ext in (".pdf", ".docx", ".md", ".txt") for p in corpus.get(ext) or []]
+    if not paths:
+        return
+    samples = []
+    total_chunks = 0
+    for run in range(repeat):
+        processor = new_processor(model, workdir, f"ingest_{run}")
+        start = time.perf_counter()
+        with quiet():
+            for path in paths:
+                processor.process_document(path)
+        samples.append(time.perf_counter() - start)
+        total_chunks = processor.collection.count()
+    results["process_document_corpus"] = summarize(samples)
+    mean_seconds = sum(samples) / len(samples)
+    results["process_document_throughput"] = throughput(total_chunks / mean_seconds if mean_seconds else 0.0, "chunks/s")
+
+def bench_process_documents_batch(results, model, corpus, workdir, repeat):
+    """The same corpus through process_documents: parallel extraction, combined embedding batches"""
+    paths = [p for ext in (".pdf", ".docx", ".md", ".txt") for p in corpus.get(ext) or []]
+    if not paths:
+        return
+    samples = []
+    total_chunks = 0
+    for run in range(repeat):
+        processor = new_processor(model, workdir, f"ingest_batch_{run}")
+        start = time.perf_counter()
+        with quiet():
+            for _ in processor.process_documents(paths):
+                pass
+        samples.append(time.perf_counter() - start)
+        total_chunks = processor.collection.count()
+    results["process_documents_batch_corpus"] = summarize(samples)
+    mean_seconds = sum(samples) / len(samples)
+    results["process_documents_batch_throughput"] = throughput(total_chunks / mean_seconds if mean_seconds else 0.0, "chunks/s")
+
+def populate(processor, model, size, seed, batch=1000):
+    """Bulk-load synthetic chunks directly, bypassing per-chunk ingestion"""
+    chunks = make_chunks(size, seed=seed)
+    for start in range(0, size, batch):
+        part = chunks[start:start + batch]
+        texts = [text for text, _ in part]
+        processor.collection.add(
+            documents=texts,
+            embeddings=model.encode(texts).tolist(),
+            metadatas=[{
+                "source": f"synthetic_{topic}.md",
+                "source_name": f"synthetic {topic}",
+                "chunk_index": start + i,
+                "total_chunks": size
+            } for i, (_, topic) in enumerate(part)],
+            ids=[f"synthetic_{start + i}" for i in range(len(part))]
+        )
+
+def bench_query(results, model, sizes, queries, workdir, seed, gemini):
+    for size in sizes:
+        processor = new_processor(model, workdir, f"query_{size}")
+        populate(processor, model, size, seed)
+        processor.query_documents(queries[0])  # load the index before timing
+
+        samples = []
+        for query in queries:
+            start = time.perf_counter()
+            processor.query_documents(query, n_results=5)
+            samples.append(time.perf_counter() - start)
+        results[f"query_documents_{size}"] = summarize(samples)
+
+        samples = []
+        for query in queries:
+            start = time.perf_counter()
+            processor.query_documents_by_source(query, source_filter="synthetic vector", n_results=5)
+            samples.append(time.perf_counter() - start)
+        results[f"query_documents_by_source_{size}"] = summarize(samples)
+
+        # Retrieval plus a fixed-latency fake LLM call, as /chat does it
+        samples = []
+        for query in queries[:20]:
+            start = time.perf_counter()
+            docs = processor.query_documents(query, n_results=5)
+            gemini.generate_response(query, "\n\n".join(d["content"] for d in docs))
+            samples.append(time.perf_counter() - start)
+        results[f"answer_pipeline_{size}"] = summarize(samples)
+
+def bench_scraper_parse(results, corpus, workdir, repeat):
+    from backend.services.web_scraper import WebScraper
+    paths = corpus.get(".html") or []
+    if not paths:
+        return
+    scraper = WebScraper(output_dir=os.path.join(workdir, "scraped"))
+    pages = []
+    for path in paths:
+        with open(path, "rb") as f:
+            pages.append(f.read())
+    results["web_scraper_parse"] = measure(lambda: [scraper.parse_html(page) for page in pages], repeat)
+
+def bench_verify_token(results, repeat):
+    import jwt
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    import auth_clerk
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({"kid": "bench-key", "use": "sig", "alg": "RS256"})
+    auth_clerk.jwks_provider.load_jwks({"keys": [jwk]})
+    now = int(time.time())
+    token = jwt.encode(
+        {"sub": "user_bench", "email": "bench@example.com", "iat": now, "exp": now + 3600},
+        private_key, algorithm="RS256", headers={"kid": "bench-key"}
+    )
+
+    async def run(cold):
+        samples = []
+        for _ in range(repeat):
+            if cold:
+                auth_clerk.token_cache.clear()
+            start = time.perf_counter()
+            await auth_clerk.verify_clerk_token(token)
+            samples.append(time.perf_counter() - start)
+        return summarize(samples)
+
+    # Per-verification INFO logging would dominate the measurement
+    logging_level = auth_clerk.logger.level
+    auth_clerk.logger.setLevel("WARNING")
+    try:
+        results["verify_clerk_token_cold"] = asyncio.run(run(cold=True))
+        results["verify_clerk_token_cached"] = asyncio.run(run(cold=False))
+    finally:
+        auth_clerk.logger.setLevel(logging_level)
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+def compare(current, baseline, threshold):
+    """Print per-benchmark change against a previous run; returns the regressed names"""
+    regressions = []
+    print(f"\n{'benchmark':<42} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, stats in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            continue
+        if "p50" in stats:
+            before, after, higher_is_better = old["p50"], stats["p50"], False
+        else:
+            before, after, higher_is_better = old["value"], stats["value"], True
+        if not before:
+            continue
+        change = after / before - 1
+        regressed = change < -threshold if higher_is_better else change > threshold
+        if regressed:
+            regressions.append(name)
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<42} {before:>12.3f} {after:>12.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", help="directory of PDF/DOCX/MD/TXT/HTML fixtures (default: generate synthetic ones)")
+    parser.add_argument("--model", help="local sentence-transformers model directory (default: hashing embedder)")
+    parser.add_argument("--sizes", default="1000,5000,20000", help="comma-separated corpus sizes (chunks) for query benchmarks")
+    parser.add_argument("--queries", type=int, default=200, help="queries per corpus size")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions for the micro-benchmarks")
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="fake Gemini latency in seconds")
+    parser.add_argument("--sharding", choices=("none", "source"), default="none", help="vector store layout (VECTOR_SHARDING)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="small sizes and few repetitions")
+    parser.add_argument("--output", help="results JSON path (default: benchmarks/results/bench-<time>-<rev>.json)")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change reported as a regression")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.sizes, args.queries, args.repeat = "500,2000", 50, 2
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    global SHARDING
+    SHARDING = args.sharding
+
+    model = load_embedding_model(args.model)
+    gemini = FakeGeminiClient(latency=args.gemini_latency, ttft=args.gemini_latency / 3)
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as workdir:
+        corpus = load_corpus(args.fixtures) if args.fixtures else build_corpus(os.path.join(workdir, "fixtures"), seed=args.seed)
+        queries = [text[:200] for text, _ in make_chunks(args.queries, seed=args.seed + 1, words=12)]
+
+        steps = [
+            ("extract_text", lambda: bench_extract(results, new_processor(model, workdir, "extract"), corpus, args.repeat)),
+            ("chunk_text", lambda: bench_chunk(results, new_processor(model, workdir, "chunk"), args.repeat, args.seed)),
+            ("process_document", lambda: bench_process_document(results, model, corpus, workdir, args.repeat)),
+            ("process_documents_batch", lambda: bench_process_documents_batch(results, model, corpus, workdir, args.repeat)),
+            ("query_documents", lambda: bench_query(results, model, sizes, queries, workdir, args.seed, gemini)),
+            ("web_scraper_parse", lambda: bench_scraper_parse(results, corpus, workdir, args.repeat)),
+            ("verify_clerk_token", lambda: bench_verify_token(results, max(args.repeat * 20, 100))),
+        ]
+        for name, step in steps:
+            start = time.perf_counter()
+            print(f"⏳ {name}...", flush=True)
+            step()
+            print(f"✅ {name} ({time.perf_counter() - start:.1f}s)")
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "embedding_model": args.model or "hashing-384",
+            "sizes": sizes,
+            "queries": args.queries,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "sharding": args.sharding,
+        },
+        "results": results,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"bench-{stamp}-{report['meta']['revision']}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"📝 Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) above {args.threshold:.0%}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
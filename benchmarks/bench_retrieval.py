@@ -0,0 +1,157 @@
+"""Flat vs hierarchical (and MMR-diversified) retrieval: latency and recall@k at growing corpus sizes.
+
+Builds synthetic corpora of documents (see fixtures.make_documents), loads them into a
+flat and a hierarchical DocumentProcessor, and compares each against exact top-k
+chunks found by brute force over all chunk embeddings, and by how often the document
+a query was taken from shows up in its results.
+
+    python -m benchmarks.bench_retrieval --documents 100,500,2000 --output retrieval.json
+"""
+
+import os
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_hot_paths import new_processor, quiet, summarize
+from benchmarks.fakes import load_embedding_model
+from benchmarks.fixtures import make_documents
+
+def load_corpus(processor, model, documents, batch=1000, embeddings=None):
+    """Store chunks directly (bypassing per-chunk ingestion); returns the chunk texts and embeddings.
+
+    Pass the embeddings of a previous load to store the same corpus without re-encoding it.
+    """
+    texts, metadatas, ids = [], [], []
+    for filename, topic, chunks in documents:
+        for i, chunk in enumerate(chunks):
+            texts.append(chunk)
+            metadatas.append({"source": filename, "source_name": f"synthetic {topic}",
+                              "chunk_index": i, "total_chunks": len(chunks)})
+            ids.append(f"{filename}_{i}")
+    if embeddings is None:
+        embeddings = np.asarray(model.encode(texts), dtype=np.float32)
+    for start in range(0, len(texts), batch):
+        end = start + batch
+        processor.collection.add(documents=texts[start:end], embeddings=embeddings[start:end].tolist(),
+                                 metadatas=metadatas[start:end], ids=ids[start:end])
+    return texts, embeddings
+
+def make_queries(documents, count, seed, words=12):
+    """Short queries sampled from random chunks, like a user asking about one document.
+
+    Returns (query, filename of the document it was taken from) pairs.
+    """
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(count):
+        filename, _, chunks = documents[rng.integers(len(documents))]
+        tokens = chunks[rng.integers(len(chunks))].split()
+        start = rng.integers(max(1, len(tokens) - words))
+        queries.append((" ".join(tokens[start:start + words]), filename))
+    return queries
+
+def run_queries(processor, queries, k, **retrieval_options):
+    samples, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        docs = processor.query_documents(query, n_results=k, **retrieval_options)
+        samples.append(time.perf_counter() - start)
+        found.append([d["content"] for d in docs])
+    return summarize(samples), found
+
+def recall(found, expected):
+    return float(np.mean([len(set(f) & e) / len(e) for f, e in zip(found, expected)]))
+
+def distinct_documents(found, text_to_document):
+    return float(np.mean([len({text_to_document[t] for t in f}) for f in found]))
+
+def source_hit_rate(found, sources, text_to_document):
+    """Share of queries whose originating document is among the retrieved chunks"""
+    return float(np.mean([source in {text_to_document[t] for t in f} for f, source in zip(found, sources)]))
+
+def score(latency, found, expected, sources, text_to_document, k):
+    return {
+        "latency": latency,
+        f"recall@{k}": recall(found, expected),
+        "source_hit_rate": source_hit_rate(found, sources, text_to_document),
+        "distinct_documents": distinct_documents(found, text_to_document),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="local sentence-transformers model directory (default: hashing embedder)")
+    parser.add_argument("--documents", default="100,500,2000", help="comma-separated corpus sizes in documents")
+    parser.add_argument("--chunks-per-document", type=int, default=10)
+    parser.add_argument("--top-documents", default="8,16,32,64", help="hierarchical first-stage sizes to compare")
+    parser.add_argument("--mmr-lambdas", default="0.5", help="MMR lambdas to compare on the flat index (empty to skip)")
+    parser.add_argument("--fetch-k", type=int, default=20, help="candidates over-fetched for MMR")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    model = load_embedding_model(args.model)
+    sizes = [int(s) for s in args.documents.split(",") if s]
+    top_documents = [int(n) for n in args.top_documents.split(",") if n]
+    mmr_lambdas = [float(x) for x in args.mmr_lambdas.split(",") if x]
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix="rag-bench-retrieval-") as workdir:
+        for size in sizes:
+            documents = make_documents(size, args.chunks_per_document, seed=args.seed)
+            queries, sources = zip(*make_queries(documents, args.queries, seed=args.seed + 1))
+            text_to_document = {chunk: filename for filename, _, chunks in documents for chunk in chunks}
+
+            flat = new_processor(model, workdir, f"retrieval_{size}")
+            texts, embeddings = load_corpus(flat, model, documents)
+            query_embeddings = np.asarray(model.encode(queries), dtype=np.float32)
+            # Exact top-k by brute force (squared L2, as Chroma's default space)
+            distances = ((query_embeddings ** 2).sum(1)[:, None] - 2 * query_embeddings @ embeddings.T
+                         + (embeddings ** 2).sum(1)[None, :])
+            expected = [{texts[i] for i in np.argsort(row)[:args.k]} for row in distances]
+
+            flat.query_documents(queries[0])  # load the index before timing
+            latency, found = run_queries(flat, queries, args.k)
+            row = {"chunks": len(texts), "flat": score(latency, found, expected, sources, text_to_document, args.k)}
+            for mmr_lambda in mmr_lambdas:
+                latency, found = run_queries(flat, queries, args.k, mmr=True, mmr_lambda=mmr_lambda, fetch_k=args.fetch_k)
+                row[f"flat_mmr{mmr_lambda:g}"] = score(latency, found, expected, sources, text_to_document, args.k)
+
+            for n in top_documents:
+                hierarchical = flat.__class__(embedding_model=model, chroma_path=flat.chroma_path,
+                                              retrieval_mode="hierarchical", top_documents=n)
+                start = time.perf_counter()
+                with quiet():
+                    hierarchical.document_index  # backfills the document index from the stored chunks
+                build_seconds = time.perf_counter() - start
+                hierarchical.query_documents(queries[0])
+                latency, found = run_queries(hierarchical, queries, args.k)
+                row[f"hierarchical_top{n}"] = score(latency, found, expected, sources, text_to_document, args.k)
+                row[f"hierarchical_top{n}"]["index_build_seconds"] = build_seconds
+            results[size] = row
+
+            print(f"\n{size} documents ({len(texts)} chunks)")
+            print(f"{'mode':<18} {'p50 ms':>8} {'p95 ms':>8} {'recall@' + str(args.k):>9} {'source hit':>11} {'docs/top-k':>11}")
+            for mode, r in row.items():
+                if mode == "chunks":
+                    continue
+                print(f"{mode:<18} {r['latency']['p50']:>8.2f} {r['latency']['p95']:>8.2f} "
+                      f"{r[f'recall@{args.k}']:>9.3f} {r['source_hit_rate']:>11.3f} {r['distinct_documents']:>11.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
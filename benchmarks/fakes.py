@@ -0,0 +1,77 @@
+# fakes.py - offline stand-ins for the embedding model and Gemini
+
+import time
+import zlib
+import numpy as np
+
+class HashingEmbedder:
+    """Deterministic, network-free embedding model with a SentenceTransformer-style encode().
+
+    Tokens are feature-hashed (crc32) into a fixed number of signed dimensions and the
+    vector is L2-normalised, so identical text always maps to the same embedding and
+    overlapping vocabulary gives a meaningful cosine similarity.
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def _embed_one(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        tokens = text.lower().split()
+        if tokens:
+            hashes = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in tokens), dtype=np.uint64, count=len(tokens))
+            indices = (hashes % self.dim).astype(np.intp)
+            signs = np.where((hashes >> 16) & 1, 1.0, -1.0).astype(np.float32)
+            np.add.at(vector, indices, signs)
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector /= norm
+        return vector
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, **kwargs):
+        if isinstance(sentences, str):
+            return self._embed_one(sentences)
+        if not sentences:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self._embed_one(s) for s in sentences])
+
+def load_embedding_model(model_path=None, dim=384):
+    """Return a local SentenceTransformer checkpoint if given, else the hashing embedder"""
+    if not model_path:
+        return HashingEmbedder(dim=dim)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_path)
+
+class FakeGeminiClient:
+    """Drop-in for GeminiClient that sleeps instead of calling the API.
+
+    latency is the total response time; with streaming, ttft (time to first token) is
+    reached after the first chunk and the remaining chunks share the rest of the latency.
+    """
+
+    def __init__(self, latency=0.5, ttft=0.15, chunks=8, stream=True,
+                 answer="This is a canned answer from the fake Gemini client."):
+        self.latency = latency
+        self.ttft = min(ttft, latency)
+        self.chunks = max(1, chunks)
+        self.stream = stream
+        self.answer = answer
+
+    def stream_response(self, prompt, context=""):
+        words = self.answer.split()
+        per_chunk = max(1, len(words) // self.chunks)
+        pieces = [" ".join(words[i:i + per_chunk]) for i in range(0, len(words), per_chunk)] or [""]
+        time.sleep(self.ttft)
+        remaining = (self.latency - self.ttft) / max(1, len(pieces) - 1) if len(pieces) > 1 else 0
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(remaining)
+                yield " " + piece
+            else:
+                yield piece
+
+    def generate_response(self, prompt, context=""):
+        if not self.stream:
+            time.sleep(self.latency)
+            return self.answer
+        return "".join(self.stream_response(prompt, context)).strip()
@@ -0,0 +1,159 @@
+# fixtures.py - reproducible synthetic corpora for the benchmarks
+
+import os
+import random
+
+# Small fixed vocabulary so generated text is deterministic for a given seed
+TOPICS = {
+    "vector": "embedding vector index search nearest neighbour cosine distance recall graph hnsw",
+    "auth": "token signature key rotation session user login clerk jwt verify expiry",
+    "web": "page html scrape crawl link header footer navigation content markup browser",
+    "llm": "prompt answer model gemini context generation stream latency sentence reply",
+    "docs": "document chunk paragraph section page file upload extract parse format",
+}
+FILLER = ("the a of and to in is for with on that this by from as are be it can "
+          "which when each into more than only also over under between").split()
+
+def make_paragraph(rng, topic=None, words=80):
+    topic = topic or rng.choice(sorted(TOPICS))
+    topic_words = TOPICS[topic].split()
+    out = []
+    for _ in range(words):
+        out.append(rng.choice(topic_words) if rng.random() < 0.45 else rng.choice(FILLER))
+    out[0] = out[0].capitalize()
+    return " ".join(out) + "."
+
+def make_text(rng, paragraphs=20, words=80):
+    return "\n\n".join(make_paragraph(rng, words=words) for _ in range(paragraphs))
+
+def make_chunks(count, seed=0, words=120):
+    """Synthetic chunk texts with their topic label (used as ground truth in recall tests)"""
+    rng = random.Random(seed)
+    topics = sorted(TOPICS)
+    chunks = []
+    for i in range(count):
+        topic = topics[i % len(topics)]
+        chunks.append((make_paragraph(rng, topic=topic, words=words), topic))
+    return chunks
+
+def make_documents(count, chunks_per_document=20, seed=0, words=120, vocabulary=12):
+    """Synthetic documents as (filename, topic, [chunk texts]).
+
+    Each document mixes its topic's words with a few terms of its own, so chunks of
+    one document are closer to each other than to other documents on the same topic.
+    """
+    rng = random.Random(seed)
+    topics = sorted(TOPICS)
+    documents = []
+    for d in range(count):
+        topic = topics[d % len(topics)]
+        own_terms = [f"term{d}x{j}" for j in range(vocabulary)]
+        chunks = []
+        for _ in range(chunks_per_document):
+            paragraph = make_paragraph(rng, topic=topic, words=words).split()
+            for i in range(len(paragraph)):
+                if rng.random() < 0.15:
+                    paragraph[i] = rng.choice(own_terms)
+            chunks.append(" ".join(paragraph))
+        documents.append((f"doc_{d:05d}.md", topic, chunks))
+    return documents
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path, text, line_chars=90, lines_per_page=60):
+    """Write a minimal, valid text PDF (Helvetica) without any PDF library"""
+    lines = []
+    for paragraph in text.split("\n"):
+        while len(paragraph) > line_chars:
+            cut = paragraph.rfind(" ", 0, line_chars)
+            cut = cut if cut > 0 else line_chars
+            lines.append(paragraph[:cut])
+            paragraph = paragraph[cut:].lstrip()
+        lines.append(paragraph)
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    objects = []  # object bodies, 1-indexed in the final file
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(None)  # pages tree, filled in once page ids are known
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for page_lines in pages:
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 760 Td"]
+        ops.extend(f"({_pdf_escape(line)}) '" for line in page_lines)
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref_at = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_at)
+    with open(path, "wb") as f:
+        f.write(out)
+
+def write_docx(path, text):
+    import docx
+    document = docx.Document()
+    for paragraph in text.split("\n\n"):
+        document.add_paragraph(paragraph)
+    document.save(path)
+
+def make_html(rng, paragraphs=30):
+    """A page with the boilerplate WebScraper strips (nav, header, footer, scripts)"""
+    body = "\n".join(f"<p>{make_paragraph(rng)}</p>" for _ in range(paragraphs))
+    nav = "".join(f'<li><a href="/page{i}">Link {i}</a></li>' for i in range(40))
+    return (
+        "<!DOCTYPE html><html><head><title>Fixture</title>"
+        "<style>body { font-family: sans-serif; }</style>"
+        "<script>window.analytics = { track: function () {} };</script></head><body>"
+        f"<header><h1>Fixture site</h1></header><nav><ul>{nav}</ul></nav>"
+        f"<main><article><h2>Section</h2>{body}</article></main>"
+        "<footer>Copyright fixture</footer></body></html>"
+    )
+
+def build_corpus(directory, seed=0, documents_per_type=3, paragraphs=40):
+    """Write PDF, DOCX, MD, TXT and HTML fixtures; returns {extension: [paths]}"""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    corpus = {".pdf": [], ".docx": [], ".md": [], ".txt": [], ".html": []}
+    for i in range(documents_per_type):
+        text = make_text(rng, paragraphs=paragraphs)
+        for ext in (".pdf", ".docx", ".md", ".txt"):
+            path = os.path.join(directory, f"fixture_{i}{ext}")
+            if ext == ".pdf":
+                write_pdf(path, text)
+            elif ext == ".docx":
+                write_docx(path, text)
+            else:
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(f"# Fixture {i}\n\n{text}" if ext == ".md" else text)
+            corpus[ext].append(path)
+        html_path = os.path.join(directory, f"fixture_{i}.html")
+        with open(html_path, "w", encoding="utf-8") as f:
+            f.write(make_html(rng, paragraphs=paragraphs))
+        corpus[".html"].append(html_path)
+    return corpus
+
+def load_corpus(directory):
+    """Collect existing fixture files by extension from a directory"""
+    corpus = {".pdf": [], ".docx": [], ".md": [], ".txt": [], ".html": []}
+    for name in sorted(os.listdir(directory)):
+        ext = os.path.splitext(name)[1].lower()
+        if ext in corpus:
+            corpus[ext].append(os.path.join(directory, name))
+    return corpus
@@ -0,0 +1,274 @@
+"""End-to-end HTTP load test for main.app with local stand-ins for Clerk and Gemini.
+
+Starts a local JWKS/static-site server, launches uvicorn on benchmarks.loadtest_app
+in a subprocess (fake Gemini, RS256 test tokens), then drives mixed traffic at a
+target request rate and reports throughput, tail latency and error rate per endpoint.
+A /health probe runs alongside the load; its latency exposes event-loop stalls.
+
+    python -m benchmarks.loadtest --rps 20 --duration 60 --workers 2
+    python -m benchmarks.loadtest --mix chat=80,sources=20 --gemini-latency 1.5
+"""
+
+import os
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.bench_hot_paths import summarize
+from benchmarks.fixtures import make_text
+from benchmarks.stand_ins import LocalClerk, StandInServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = "chat=45,chat-by-source=15,sources=25,upload=12,scrape=3"
+QUESTIONS = [
+    "How does vector search find the nearest neighbour?",
+    "What happens when a signing key is rotated?",
+    "Which parts of a page are removed when scraping?",
+    "How is the prompt built for the model?",
+    "How are documents split into chunks?",
+]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - {"chat", "chat-by-source", "sources", "upload", "scrape"}
+    if unknown:
+        raise SystemExit(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    return weights
+
+def start_app(args, jwks_url, workdir):
+    env = dict(os.environ)
+    env.update({
+        "CLERK_JWKS_URL": jwks_url,
+        "LOADTEST_GEMINI_LATENCY": str(args.gemini_latency),
+        "LOADTEST_GEMINI_TTFT": str(args.gemini_ttft),
+        "LOADTEST_GEMINI_STREAM": "0" if args.no_stream else "1",
+        "LOADTEST_EMBEDDER": "hashing" if args.hashing_embedder else "model",
+        # Measure raw capacity unless the per-user limits are what's being tested
+        "ADMISSION_CONTROL": "1" if args.admission else "0",
+        "PYTHONPATH": REPO_ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    command = [
+        sys.executable, "-m", "uvicorn", "benchmarks.loadtest_app:app",
+        "--host", "127.0.0.1", "--port", str(args.port),
+        "--workers", str(args.workers), "--log-level", "warning",
+    ]
+    # Run from a scratch directory so chroma_db/, temp_files/ and scraped_content/ stay out of the repo
+    log = open(os.path.join(workdir, "server.log"), "w")
+    return subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT), log
+
+async def wait_ready(base_url, timeout):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/health", timeout=2)).status_code == 200:
+                    return True
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    return False
+
+class LoadGenerator:
+    def __init__(self, args, base_url, tokens, page_urls):
+        self.args = args
+        self.base_url = base_url
+        self.tokens = tokens
+        self.page_urls = page_urls
+        self.rng = random.Random(args.seed)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.status_counts = defaultdict(lambda: defaultdict(int))
+        self.upload_seq = 0
+
+    def _request(self, endpoint):
+        question = self.rng.choice(QUESTIONS)
+        if endpoint == "chat":
+            return "POST", "/chat", {"json": {"prompt": question}}
+        if endpoint == "chat-by-source":
+            return "POST", "/chat-by-source", {"json": {"prompt": question}, "params": {"source_filter": "loadtest upload 0"}}
+        if endpoint == "sources":
+            return "GET", "/sources", {}
+        if endpoint == "upload":
+            self.upload_seq += 1
+            text = make_text(self.rng, paragraphs=self.args.upload_paragraphs)
+            name = f"loadtest_upload_{self.upload_seq % 50}.md"
+            return "POST", "/upload", {"files": {"file": (name, text.encode(), "text/markdown")}}
+        return "POST", "/scrape", {"json": {"url": self.rng.choice(self.page_urls)}}
+
+    async def _fire(self, client, semaphore, endpoint, scheduled_at):
+        method, path, kwargs = self._request(endpoint)
+        headers = {"Authorization": f"Bearer {self.rng.choice(self.tokens)}"}
+        async with semaphore:
+            try:
+                response = await client.request(method, path, headers=headers, timeout=self.args.timeout, **kwargs)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+        # Measured from the scheduled send time so queueing behind the concurrency cap counts
+        self.latencies[endpoint].append(time.perf_counter() - scheduled_at)
+        self.status_counts[endpoint][str(status)] += 1
+        if not (isinstance(status, int) and status < 400):
+            self.errors[endpoint] += 1
+
+    async def _probe(self, client, stop):
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                response = await client.get("/health", timeout=self.args.timeout)
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            self.latencies["health_probe"].append(time.perf_counter() - start)
+            if not ok:
+                self.errors["health_probe"] += 1
+            await asyncio.sleep(self.args.probe_interval)
+
+    async def run(self, mix):
+        endpoints, weights = zip(*mix.items())
+        limits = httpx.Limits(max_connections=self.args.concurrency + 5)
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        stop = asyncio.Event()
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits) as client, \
+                httpx.AsyncClient(base_url=self.base_url) as probe_client:
+            probe = asyncio.create_task(self._probe(probe_client, stop))
+            tasks = []
+            start = time.perf_counter()
+            interval = 1.0 / self.args.rps
+            next_at = start
+            # Open-loop arrivals: requests are sent on schedule whether or not earlier ones finished
+            while next_at - start < self.args.duration:
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                endpoint = self.rng.choices(endpoints, weights)[0]
+                tasks.append(asyncio.create_task(self._fire(client, semaphore, endpoint, next_at)))
+                next_at += self.rng.expovariate(1.0 / interval) if self.args.poisson else interval
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+            stop.set()
+            await probe
+        return elapsed
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            stats = summarize(samples)
+            stats.update({
+                "requests": len(samples),
+                "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+                "errors": self.errors[endpoint],
+                "error_rate": self.errors[endpoint] / len(samples) if samples else 0.0,
+                "status": dict(self.status_counts.get(endpoint, {})),
+            })
+            endpoints[endpoint] = stats
+        return endpoints
+
+def print_report(endpoints):
+    print(f"\n{'endpoint':<16} {'reqs':>6} {'rps':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>8}")
+    for name, s in endpoints.items():
+        print(f"{name:<16} {s['requests']:>6} {s['throughput_rps']:>7.2f} {s['p50']:>9.1f} {s['p95']:>9.1f} "
+              f"{s['p99']:>9.1f} {s['max']:>9.1f} {s['error_rate']:>7.1%}")
+
+async def seed_corpus(base_url, token, documents, paragraphs, seed):
+    """Upload a few documents before the measured run so chat has something to retrieve"""
+    rng = random.Random(seed)
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for i in range(documents):
+            text = make_text(rng, paragraphs=paragraphs)
+            files = {"file": (f"loadtest_upload_{i}.md", text.encode(), "text/markdown")}
+            await client.post("/upload", files=files, headers={"Authorization": f"Bearer {token}"}, timeout=120)
+
+async def run(args):
+    mix = parse_mix(args.mix)
+    clerk = LocalClerk()
+    stand_in = StandInServer(clerk, seed=args.seed).start()
+    tokens = [clerk.mint_token(f"user_loadtest_{i}") for i in range(args.users)]
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    with tempfile.TemporaryDirectory(prefix="rag-loadtest-") as workdir:
+        server, log = start_app(args, stand_in.jwks_url, workdir)
+        try:
+            print(f"🚀 Starting app on {base_url} ({args.workers} worker(s))...")
+            if not await wait_ready(base_url, args.startup_timeout):
+                log.flush()
+                with open(log.name) as f:
+                    print(f.read()[-4000:])
+                raise SystemExit("❌ App did not become healthy")
+            print(f"📄 Seeding {args.seed_documents} documents...")
+            await seed_corpus(base_url, tokens[0], args.seed_documents, args.upload_paragraphs, args.seed)
+
+            print(f"🔥 {args.rps} req/s for {args.duration}s, concurrency {args.concurrency}, mix {args.mix}")
+            generator = LoadGenerator(args, base_url, tokens, stand_in.page_urls())
+            elapsed = await generator.run(mix)
+            endpoints = generator.report(elapsed)
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+            log.close()
+            stand_in.stop()
+
+    print_report(endpoints)
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "elapsed_seconds": elapsed,
+        "jwks_fetches": stand_in.jwks_requests,
+        "endpoints": endpoints,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"📝 Report written to {args.output}")
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=10.0, help="target request rate")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--concurrency", type=int, default=32, help="max requests in flight")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint weights, e.g. chat=50,sources=50")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times instead of a fixed rate")
+    parser.add_argument("--users", type=int, default=10, help="distinct test users (tokens)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=0, help="app port (default: a free port)")
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="fake Gemini total latency in seconds")
+    parser.add_argument("--gemini-ttft", type=float, default=0.15, help="fake Gemini time to first token in seconds")
+    parser.add_argument("--no-stream", action="store_true", help="fake Gemini returns in one blocking call")
+    parser.add_argument("--hashing-embedder", action="store_true", help="use the offline hashing embedder instead of the real model")
+    parser.add_argument("--admission", action="store_true", help="keep per-user admission control on (429s count as errors)")
+    parser.add_argument("--seed-documents", type=int, default=5)
+    parser.add_argument("--upload-paragraphs", type=int, default=20)
+    parser.add_argument("--probe-interval", type=float, default=0.1, help="seconds between /health probes")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+    if not args.port:
+        args.port = free_port()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""ASGI entrypoint for load tests: main.app wired to local stand-ins.
+
+Configured through environment variables (set by benchmarks.loadtest):
+
+    CLERK_JWKS_URL            local JWKS server that signs the test tokens
+    LOADTEST_GEMINI_LATENCY   fake Gemini total latency in seconds
+    LOADTEST_GEMINI_TTFT      fake Gemini time to first token in seconds
+    LOADTEST_GEMINI_STREAM    "1" to stream chunks, "0" for one blocking sleep
+    LOADTEST_EMBEDDER         "hashing" for the offline embedder, "model" for the real one
+
+    uvicorn benchmarks.loadtest_app:app --workers 4
+"""
+
+import os
+
+os.environ.setdefault("GEMINI_API_KEY", "loadtest-fake-key")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+from benchmarks.fakes import FakeGeminiClient, HashingEmbedder
+import main
+from backend.routes import chat
+from backend.services.document_processor import get_document_processor
+
+chat.gemini = FakeGeminiClient(
+    latency=float(os.getenv("LOADTEST_GEMINI_LATENCY", "0.5")),
+    ttft=float(os.getenv("LOADTEST_GEMINI_TTFT", "0.15")),
+    stream=os.getenv("LOADTEST_GEMINI_STREAM", "1") == "1",
+)
+
+if os.getenv("LOADTEST_EMBEDDER", "model") == "hashing":
+    get_document_processor().embedding_model = HashingEmbedder()
+
+app = main.app
@@ -0,0 +1,89 @@
+# stand_ins.py - local Clerk JWKS server and static site for load tests
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from benchmarks.fixtures import make_html
+
+JWKS_PATH = "/.well-known/jwks.json"
+
+class LocalClerk:
+    """Signs RS256 test tokens and serves the matching JWKS, like Clerk does"""
+
+    def __init__(self, kid="loadtest-key"):
+        self.kid = kid
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def jwks(self):
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(self.private_key.public_key()))
+        jwk.update({"kid": self.kid, "use": "sig", "alg": "RS256"})
+        return {"keys": [jwk]}
+
+    def mint_token(self, user_id, ttl=3600, **claims):
+        now = int(time.time())
+        payload = {"sub": user_id, "email": f"{user_id}@example.com", "iat": now, "exp": now + ttl}
+        payload.update(claims)
+        return jwt.encode(payload, self.private_key, algorithm="RS256", headers={"kid": self.kid})
+
+class StandInServer:
+    """Threaded HTTP server for the JWKS document and a few static pages to scrape"""
+
+    def __init__(self, clerk, host="127.0.0.1", port=0, pages=20, seed=0):
+        rng = random.Random(seed)
+        self.clerk = clerk
+        self.pages = {f"/site/page{i}.html": make_html(rng).encode("utf-8") for i in range(pages)}
+        self.jwks_requests = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def jwks_url(self):
+        return self.base_url + JWKS_PATH
+
+    def page_urls(self):
+        return [self.base_url + path for path in self.pages]
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == JWKS_PATH:
+                    stand_in.jwks_requests += 1
+                    body, content_type = json.dumps(stand_in.clerk.jwks()).encode(), "application/json"
+                elif self.path in stand_in.pages:
+                    body, content_type = stand_in.pages[self.path], "text/html; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -1,12 +1,65 @@
 # ✅ main.py
+import time
+_import_start = time.perf_counter()
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from backend.routes import upload, scrape, chat
-from auth_clerk import get_current_user_id, get_current_user, verify_clerk_token
-import requests
+from backend.services import metrics
+from backend.services.startup import startup
+from backend.services import extraction, profiling
+from auth_clerk import get_current_user_id, get_current_user, verify_clerk_token, jwks_provider
+
+startup.record("import_app", time.perf_counter() - _import_start)
+
+# Load models and indexes in the background at startup instead of on the first request
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "1") == "1"
+
+def warm_embedding_model():
+    chat.doc_processor.embedding_model.encode("warm up")
+
+def warm_vector_store():
+    chat.doc_processor.collection.count()
+
+def warm_vector_index():
+    # The first query loads the HNSW index into memory
+    if chat.doc_processor.collection.count():
+        chat.doc_processor.query_documents("warm up", n_results=1)
+
+def warm_gemini():
+    # Imports and configures the SDK; no request is sent
+    getattr(chat.gemini, "model", None)
+
+async def warm_jwks():
+    # The refresh loop keeps retrying, so stay pending until Clerk's keys arrive
+    await jwks_provider.wait_until_loaded()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fetch Clerk signing keys in the background and keep them fresh
+    await jwks_provider.start()
+    warm_up_task = None
+    if WARM_UP_ON_STARTUP:
+        warm_up_task = asyncio.create_task(startup.warm_up([
+            {
+                "embedding_model": warm_embedding_model,
+                "vector_store": warm_vector_store,
+                "gemini": warm_gemini,
+                "jwks": warm_jwks,
+            },
+            {"vector_index": warm_vector_index},
+        ]))
+    yield
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
+    extraction.shutdown()
+    await jwks_provider.stop()
 
-app = FastAPI(title="RAG Q&A Engine", version="1.0.0")
+app = FastAPI(title="RAG Q&A Engine", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,14 +69,89 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    """Profile the request when an allowed user asks for it (X-Profile: 1) or it's sampled"""
+    profile = await profiling.begin(request)
+    if profile is None:
+        return await call_next(request)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        profiling.finish(profile, 500)
+        raise
+    return profiling.wrap_response(profile, response)
+
+@app.middleware("http")
+async def server_timing_middleware(request: Request, call_next):
+    """Record request latency and return per-stage timings in a Server-Timing header"""
+    timings = metrics.start_request_timings()
+    start = time.perf_counter()
+    metrics.IN_FLIGHT.inc(component="http")
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        metrics.IN_FLIGHT.dec(component="http")
+        elapsed = time.perf_counter() - start
+        # Label by route template, not raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            elapsed,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status_code
+        )
+    response.headers["Server-Timing"] = metrics.format_server_timing(timings, elapsed)
+    return response
+
 @app.get("/")
 def root():
     return {"msg": "RAG Q&A Engine API", "version": "1.0.0"}
 
 @app.get("/health")
 def health_check():
+    """Liveness: the process is up and serving requests"""
     return {"status": "healthy"}
 
+@app.get("/ready")
+def readiness_check():
+    """Readiness: models, vector store and auth keys are loaded; includes the startup timing report"""
+    report = startup.report()
+    if not WARM_UP_ON_STARTUP:
+        report["ready"] = True
+    if report["ready"]:
+        status = "ready"
+    elif report["errors"]:
+        status = "failed"
+    else:
+        status = "starting"
+    return JSONResponse(status_code=200 if report["ready"] else 503, content={"status": status, **report})
+
+@app.get("/profiles")
+def list_profiles(user_id: str = Depends(profiling.require_profiler)):
+    """Stored request profiles, slowest first"""
+    return {"profiles": profiling.list_profiles()}
+
+@app.get("/profiles/{profile_id}")
+def get_profile(profile_id: str, format: str = "json", user_id: str = Depends(profiling.require_profiler)):
+    """One profile as JSON, or with format=collapsed as folded stacks for flamegraph tools"""
+    report = profiling.load(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        return PlainTextResponse("\n".join(report["collapsed"]) + "\n")
+    return report
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(
+        metrics.registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 @app.post("/verify-token")
 async def verify_token_post(request: Request):
     try:
@@ -37,7 +165,7 @@ async def verify_token_post(request: Request):
         token = auth_header.split(" ")[1]
         
         try:
-            payload = verify_clerk_token(token)
+            payload = await verify_clerk_token(token)
             return {
                 "status": "valid",
                 "user_id": payload.get("sub"),
@@ -68,7 +196,7 @@ async def debug_auth(request: Request):
         token = auth_header.split(" ")[1]
         
         try:
-            payload = verify_clerk_token(token)
+            payload = await verify_clerk_token(token)
             return {
                 "status": "success",
                 "message": "Token is valid!",